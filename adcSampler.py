@@ -0,0 +1,60 @@
+from array import array
+
+
+# Oversampled reading of one or more ADC channels. read() takes `samples`
+# back-to-back read_u16() of every channel in one pass, drops the `trim`
+# lowest and highest reads of each channel and averages the rest (the
+# median when only one or two are left), then applies the channel's linear
+# calibration value = a * raw + b. Buffers and coefficients are set up
+# once, read() does not allocate.
+class AdcSampler:
+    def __init__(self, samples=16, trim=4):
+        if samples - 2 * trim < 1:
+            raise ValueError('trim leaves no samples')
+        self.samples = samples
+        self.trim = trim
+        self.raw = array('H', [0] * samples)
+        self.adcs = []
+        self.scales = array('f')  # a / number of averaged reads
+        self.offsets = array('f')
+        self.values = array('f')
+
+    # Register adc; returns the index of its value in read()
+    def add_channel(self, adc, a=1.0, b=0.0):
+        self.adcs.append(adc)
+        self.scales.append(a / (self.samples - 2 * self.trim))
+        self.offsets.append(b)
+        self.values.append(0)
+        return len(self.adcs) - 1
+
+    # Read every channel, returns the calibrated values (reused array)
+    def read(self):
+        raw = self.raw
+        n = self.samples
+        for c in range(len(self.adcs)):
+            read_u16 = self.adcs[c].read_u16
+            for i in range(n):
+                raw[i] = read_u16()
+            # 挿入ソート (n は小さい)
+            for i in range(1, n):
+                v = raw[i]
+                j = i - 1
+                while j >= 0 and raw[j] > v:
+                    raw[j + 1] = raw[j]
+                    j -= 1
+                raw[j + 1] = v
+            total = 0
+            for i in range(self.trim, n - self.trim):
+                total += raw[i]
+            self.values[c] = self.scales[c] * total + self.offsets[c]
+        return self.values
+
+
+if __name__ == '__main__':
+    import machine
+    sampler = AdcSampler()
+    temp = sampler.add_channel(machine.ADC(4), -3.3 / (65535 * 0.001721),
+                               27 + 0.706/0.001721)
+    vsys = sampler.add_channel(machine.ADC(29), 3 * 3.3 / 65535)
+    values = sampler.read()
+    print(values[temp], values[vsys])
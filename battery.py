@@ -4,6 +4,7 @@
 # Remember to save this code as main.py on your Pico if you want it to run automatically!
 
 from machine import ADC, Pin
+from adcSampler import AdcSampler
 
 
 class Battery:
@@ -17,6 +18,13 @@ class Battery:
     empty_battery = 2.8
     battery_range = full_battery - empty_battery
 
+    # Pass an AdcSampler shared with other sensors to read them in one
+    # pass (sampler.read(), then voltage()).
+    def __init__(self, sampler=None):
+        self.sampler = AdcSampler() if sampler is None else sampler
+        self.channel = self.sampler.add_channel(
+            self.vsys, self.conversion_factor)
+
     def getSOC(self):
         # convert the raw ADC read into a voltage, and then a percentage
         voltage = self.getVoltage()
@@ -26,8 +34,14 @@ class Battery:
         # print('{:.0f} % {:.2f} V'.format(percentage, voltage))
         return percentage
 
+    # Oversampled, see AdcSampler
     def getVoltage(self):
-        return self.vsys.read_u16() * self.conversion_factor
+        self.sampler.read()
+        return self.voltage()
+
+    # Voltage from the last sampler.read()
+    def voltage(self):
+        return self.sampler.values[self.channel]
 
     def isCharge(self):
         return self.charging.value() == 1
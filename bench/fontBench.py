@@ -0,0 +1,77 @@
+# get_ch() throughput of the hgn fonts: the direct glyph index against the
+# binary search over _sparse that it replaced.
+#   Pico: mpremote run bench/fontBench.py (with font/ on the board)
+#   Host: PYTHONPATH=.:tests/fakes python bench/fontBench.py
+import gc
+import sys
+import utime
+
+FONTS = ('16', '24', '40b')
+TEXT = '21.5\xb0C 3.90V 100% ?x'  # x is not in the fonts
+LOOKUPS = 20000
+
+ifb = lambda l : l[0] | (l[1] << 8)
+
+
+# The lookup get_ch() did before the direct index
+def bs(lst, val):
+    while True:
+        m = (len(lst) & ~ 7) >> 1
+        v = ifb(lst[m:])
+        if v == val:
+            return ifb(lst[m + 2:])
+        if not m:
+            return 0
+        lst = lst[m:] if v < val else lst[:m]
+
+
+def search_get_ch(font):
+    mvfont = font._mvfont
+    mvsp = font._mvsp
+    ht = font.height()
+
+    def get_ch(ch):
+        doff = bs(mvsp, ord(ch))
+        width = ifb(mvfont[doff : ])
+        next_offs = doff + 2 + ((width - 1)//8 + 1) * ht
+        return mvfont[doff + 2:next_offs], ht, width
+    return get_ch
+
+
+def mismatches(get_ch, reference, font):
+    count = 0
+    for c in range(font.max_ch() + 2):
+        a = get_ch(chr(c))
+        b = reference(chr(c))
+        if bytes(a[0]) != bytes(b[0]) or a[1:] != b[1:]:
+            count += 1
+    return count
+
+
+def run(get_ch):
+    text = TEXT
+    gc.collect()
+    t = utime.ticks_us()
+    for i in range(LOOKUPS // len(text)):
+        for ch in text:
+            get_ch(ch)
+    return utime.ticks_diff(utime.ticks_us(), t)
+
+
+def main():
+    n = LOOKUPS // len(TEXT) * len(TEXT)
+    print('get_ch, {} lookups: search -> index'.format(n))
+    for size in FONTS:
+        name = 'font.hgn.' + size
+        __import__(name)
+        font = sys.modules[name]
+        search = search_get_ch(font)
+        before = run(search)
+        after = run(font.get_ch)
+        print('{:>3}: {:8.1f} ms -> {:6.1f} ms ({:.1f}x), {} mismatches'.format(
+            size, before / 1000, after / 1000, before / max(after, 1),
+            mismatches(font.get_ch, search, font)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Chart plotting cost against the length of the raw history, 100 to 10000
+# points in view: mapping the points to pixels with map_points() against
+# the per-index mapping it replaced, and plot_series() with each
+# GraphPaper.decimation, which should stay flat once the points outnumber
+# the pixel columns.
+#   Pico: mpremote run bench/plotBench.py
+#   Host: PYTHONPATH=.:tests/fakes python bench/plotBench.py
+import gc
+import math
+import utime
+from dataCollector import DataCollector
+from graphPager import GraphData, GraphPaper
+
+SIZES = (100, 1000, 10000)
+DECIMATION_SIZES = (100, 1000, 3000, 10000)
+DECIMATIONS = (None, 'minmax', 'lttb')
+REPEAT = 5
+
+
+# A collector holding n commits that fill the raw view up to now
+def history(paper, n):
+    span = int(paper.now_pos * paper.cell_width * paper.seconds_per_pixel)
+    interval = max(1, span // n)
+    collector = DataCollector(lambda: 0, count_max=n, interval=interval)
+    t = utime.time() - n * interval
+    for i in range(n):
+        t += interval
+        # As restore() does, without a SampleLog
+        collector._push(20 + 3 * math.sin(i * 20 / n) + (i * 7919 % 13) * 0.05, t)
+    collector._publish()
+    return collector, interval
+
+
+# Best of REPEAT runs of f(), in ms
+def best(f):
+    result = None
+    for _ in range(REPEAT):
+        gc.collect()
+        t = utime.ticks_us()
+        f()
+        dt = utime.ticks_diff(utime.ticks_us(), t)
+        if result is None or dt < result:
+            result = dt
+    return result / 1000
+
+
+# The mapping plot_series() did before map_points(): one indexed read of
+# the times and values per point
+def per_index(paper, series, i0, i1, now):
+    x_now = paper.margin_left + paper.now_pos*paper.cell_width
+    times = series.times
+    values = series.values
+    points = []
+    for i in range(i0, i1):
+        x = x_now - int((now - times[i]) / paper.seconds_per_pixel)
+        points.append((x, int(series.zero_y - series.height_per_unit*values[i])))
+    return points
+
+
+def bench_map(paper):
+    print('points  per-index  map_points (ms)')
+    for n in SIZES:
+        collector, interval = history(paper, n)
+        paper.data_interval = interval
+        series = GraphData(collector.snapshot(), paper.cell_height,
+                           paper.margin_top)
+        now = utime.time()
+        t0 = now - int(paper.now_pos*paper.cell_width*paper.seconds_per_pixel)
+        i0, i1 = series.data.slice(t0, now + 1)
+        before = best(lambda: per_index(paper, series, i0, i1, now))
+        after = best(lambda: paper.map_points(series, i0, i1, now))
+        print('{:6d} {:10.2f} {:11.2f}'.format(n, before, after))
+        del collector, series
+
+
+def bench_decimation(paper):
+    print('points  ' + ''.join('{:>9}'.format(str(d)) for d in DECIMATIONS) +
+          '  plot_series (ms)')
+    for n in DECIMATION_SIZES:
+        collector, interval = history(paper, n)
+        paper.data_interval = interval
+        series = GraphData(collector.snapshot(), paper.cell_height,
+                           paper.margin_top)
+        now = utime.time()
+        t0 = now - int(paper.now_pos*paper.cell_width*paper.seconds_per_pixel)
+        row = '{:6d}  '.format(n)
+        for decimation in DECIMATIONS:
+            paper.decimation = decimation
+            row += '{:9.1f}'.format(
+                best(lambda: paper.plot_series(series, t0, now, 1)))
+        print(row)
+        del collector, series
+    paper.decimation = GraphPaper.decimation
+
+
+def main():
+    empty = DataCollector(lambda: 0)
+    paper = GraphPaper(empty, empty, empty.interval)
+    bench_map(paper)
+    bench_decimation(paper)
+
+
+if __name__ == '__main__':
+    main()
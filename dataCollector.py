@@ -1,4 +1,6 @@
 import math
+from array import array
+from utime import time
 
 
 def GetScale(x):
@@ -9,44 +11,424 @@ def GetScale(x):
         return int(math.floor(log))
 
 
+# Read-only window of `count` values of a circular array starting at
+# `start`. Indexing and iteration go from the oldest to the newest value,
+# negative indexes count from the newest.
+class RingView:
+    def __init__(self, data, start=0, count=0):
+        self.data = data
+        self.size = len(data)
+        self.start = start
+        self.count = count
+
+    # Take over the current window of ring (same storage)
+    def update(self, ring):
+        self.start = ring.start
+        self.count = ring.count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if i < 0 or i >= self.count:
+            raise IndexError('RingBuffer index out of range')
+        i += self.start
+        if i >= self.size:
+            i -= self.size
+        return self.data[i]
+
+    def __iter__(self):
+        data = self.data
+        i = self.start
+        for _ in range(self.count):
+            yield data[i]
+            i += 1
+            if i == self.size:
+                i = 0
+
+
+# Fixed-capacity circular buffer backed by an array ('f': 4 bytes/value).
+# Appending to a full buffer drops the oldest value. `spare` extra slots
+# delay the reuse of dropped slots, so a RingView taken from the buffer
+# stays valid for `spare` further appends.
+class RingBuffer(RingView):
+    def __init__(self, capacity, typecode='f', spare=0):
+        super().__init__(array(typecode, [0] * (capacity + spare)))
+        self.capacity = capacity
+
+    def append(self, value):
+        end = self.start + self.count
+        if end >= self.size:
+            end -= self.size
+        self.data[end] = value
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start += 1
+            if self.start == self.size:
+                self.start = 0
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def view(self):
+        return RingView(self.data, self.start, self.count)
+
+
+# First index of the sorted RingBuffer `ring` whose value is >= value
+def bisect(ring, value):
+    lo = 0
+    hi = len(ring)
+    while lo < hi:
+        m = (lo + hi) // 2
+        if ring[m] < value:
+            lo = m + 1
+        else:
+            hi = m
+    return lo
+
+
+# Sliding-window maximum (minimum with is_max=False) over sequence-numbered
+# values. Values that can no longer become the extreme are dropped on push,
+# so push/expire/front are amortized O(1) and at most `capacity` values are
+# kept for a window of that size.
+class MonotonicQueue:
+    def __init__(self, capacity, is_max=True):
+        self.seqs = array('i', [0] * capacity)
+        self.values = array('f', [0] * capacity)
+        self.capacity = capacity
+        self.sign = 1 if is_max else -1
+        self.head = 0
+        self.count = 0
+
+    def push(self, seq, value):
+        value *= self.sign
+        while self.count:
+            back = self.head + self.count - 1
+            if back >= self.capacity:
+                back -= self.capacity
+            if self.values[back] > value:
+                break
+            self.count -= 1
+        end = self.head + self.count
+        if end >= self.capacity:
+            end -= self.capacity
+        self.seqs[end] = seq
+        self.values[end] = value
+        self.count += 1
+
+    # Drop values older than seq
+    def expire(self, seq):
+        while self.count and self.seqs[self.head] < seq:
+            self.head += 1
+            if self.head == self.capacity:
+                self.head = 0
+            self.count -= 1
+
+    def front(self):
+        return self.values[self.head] * self.sign
+
+
+# Rollup of committed values: every `period` commits the mean, min and max
+# of that period, stamped with the middle of the period, are appended to
+# fixed-size rings. max/min cover the
+# rollups held in the rings (the partial period until the first rollup).
+class Tier:
+    def __init__(self, name, period, capacity):
+        self.name = name
+        self.period = period
+        self.mean = RingBuffer(capacity, spare=1)
+        self.times = RingBuffer(capacity, 'i', spare=1)
+        self.low = RingBuffer(capacity)
+        self.high = RingBuffer(capacity)
+        self.window_max = MonotonicQueue(capacity)
+        self.window_min = MonotonicQueue(capacity, False)
+        self.seq = 0
+        self.count = 0  # Commits in the current period
+        self.start = 0  # Time of the first commit of the current period
+        self.sum = 0
+        self.period_min = 0
+        self.period_max = 0
+
+    @property
+    def max(self):
+        return self.window_max.front() if self.seq else self.period_max
+
+    @property
+    def min(self):
+        return self.window_min.front() if self.seq else self.period_min
+
+    def add(self, value, t):
+        if self.count == 0:
+            self.start = t
+            self.sum = 0
+            self.period_min = value
+            self.period_max = value
+        self.sum += value
+        self.period_min = min(self.period_min, value)
+        self.period_max = max(self.period_max, value)
+        self.count += 1
+        if self.count == self.period:
+            self.mean.append(self.sum / self.count)
+            self.times.append((self.start + t) // 2)
+            self.low.append(self.period_min)
+            self.high.append(self.period_max)
+            seq = self.seq
+            self.seq += 1
+            capacity = self.mean.capacity
+            self.window_max.expire(seq - capacity + 1)
+            self.window_min.expire(seq - capacity + 1)
+            self.window_max.push(seq, self.period_max)
+            self.window_min.push(seq, self.period_min)
+            self.count = 0
+
+
+# Published state of a Tier, see Snapshot
+class TierSnapshot:
+    def __init__(self, tier):
+        self.period = tier.period
+        self.mean = tier.mean.view()
+        self.times = tier.times.view()
+        self.max = 0
+        self.min = 0
+
+    def update(self, tier):
+        self.mean.update(tier.mean)
+        self.times.update(tier.times)
+        self.max = tier.max
+        self.min = tier.min
+
+
+# Consistent, read-only state of a DataCollector as of one commit. The
+# history is not copied: the views share the collector's ring storage and
+# only record the window. Offers the same reading API as DataCollector.
+class Snapshot:
+    def __init__(self, data):
+        self.values = data.commited_data.view()
+        self.times = data.commit_times.view()
+        self.tiers = {}
+        for name, tier in data.tiers.items():
+            self.tiers[name] = TierSnapshot(tier)
+        self.seq = 0
+        self.max = 0
+        self.min = 0
+        self.average_whole = 0
+        self.stddev = 0
+        self.scale = 0
+        self.last_value = 0
+
+    def update(self, data):
+        self.values.update(data.commited_data)
+        self.times.update(data.commit_times)
+        for name, tier in data.tiers.items():
+            self.tiers[name].update(tier)
+        self.seq = data.seq
+        self.max = data.max
+        self.min = data.min
+        self.average_whole = data.average_whole
+        self.stddev = data.stddev
+        self.scale = data.scale
+        self.last_value = data.last_value
+        if not self.seq:
+            # Nothing committed yet: like max/min, the tiers give the last
+            # sample
+            for tier in self.tiers.values():
+                tier.max = tier.min = self.last_value
+
+    def get_data(self, tier=None):
+        if tier is None:
+            return self.values
+        return self.tiers[tier].mean
+
+    def get_times(self, tier=None):
+        if tier is None:
+            return self.times
+        return self.tiers[tier].times
+
+    def slice(self, t0, t1, tier=None):
+        times = self.get_times(tier)
+        return bisect(times, t0), bisect(times, t1)
+
+
+# DataCollector samples fn_get_value on add() and commits the average of
+# those samples on commit(). max/min/average_whole/stddev describe the
+# committed window (the last count_max commits) and are kept up to date
+# incrementally; before the first commit max/min are the last sample.
+# Commits also feed the rollup tiers: 'hour' (7 days) and 'day' (30 days),
+# given the commit interval in seconds. Every committed value is stamped
+# with its commit time (utime.time()) in a parallel ring, see slice(). With
+# a SampleLog every commit is also appended to flash, and restore() reloads
+# the window after a reset.
+# add()/commit() may run on the other core (_thread) while the display
+# reads: readers take snapshot() instead of reading the collector, which
+# needs no lock. Each commit fills the spare one of two Snapshots and then
+# swaps it in with a single assignment. The rings keep one spare slot, so
+# a snapshot stays consistent until the second commit after it was taken.
+# Until the first commit, add() publishes too, so max/min follow the last
+# sample as on the collector.
 class DataCollector:
-    max = -10000
-    min = 10000
     count_max = 100
+    hour_count = 24 * 7
+    day_count = 30
 
-    def __init__(self, fn_get_value, name=''):
-        self.commited_data = []
+    def __init__(self, fn_get_value, name='', count_max=None, interval=600, log=None):
+        if count_max is not None:
+            self.count_max = count_max
+        self.interval = interval
+        self.log = log
+        self.tiers = {
+            'hour': Tier('hour', max(1, 3600 // interval), self.hour_count),
+            'day': Tier('day', max(1, 86400 // interval), self.day_count),
+        }
+        self.commited_data = RingBuffer(self.count_max, spare=1)
+        self.commit_times = RingBuffer(self.count_max, 'i', spare=1)
+        self.window_max = MonotonicQueue(self.count_max)
+        self.window_min = MonotonicQueue(self.count_max, False)
+        self.seq = 0  # Sequence number of the next commit
+        # Sums of (value - shift) over the window for mean/stddev. Rebuilt
+        # from the buffer every count_max commits to stop rounding drift.
+        self.shift = 0
+        self.sum = 0
+        self.sum_sq = 0
         self.data_count = 0
         self.average = 0
         self.average_whole = 0
+        self.stddev = 0
         self.scale = 0
         self.last_value = 0
         self.fn_get_value = fn_get_value
         self.name = name
+        self.snapshots = (Snapshot(self), Snapshot(self))
+        self.current = self.snapshots[0]
 
     def add(self):
         value = self.fn_get_value()
         self.average = (self.data_count * self.average +
                         value) / (self.data_count+1)
         self.data_count += 1
-        self.max = max(self.max, value)
-        self.min = min(self.min, value)
         self.last_value = value
+        if not self.seq:
+            self._publish()  # max/min follow the samples until a commit
+
+    @property
+    def max(self):
+        return self.window_max.front() if self.seq else self.last_value
+
+    @property
+    def min(self):
+        return self.window_min.front() if self.seq else self.last_value
 
     def commit(self):
         self.data_count = 0
-        self.commited_data.append(self.average)
-        if(len(self.commited_data) > self.count_max):
-            self.commited_data = self.commited_data[1:]
+        t = time()
+        if len(self.commit_times) and t < self.commit_times[-1]:
+            t = self.commit_times[-1]  # Clock went back: keep times sorted
+        if self.log is not None:
+            self.log.append(t, self.average)
+        self._push(self.average, t)
+        self._publish()
+
+    # The latest published Snapshot
+    def snapshot(self):
+        return self.current
+
+    def _publish(self):
+        spare = self.snapshots[1] if self.current is self.snapshots[0] else self.snapshots[0]
+        spare.update(self)
+        self.current = spare
+
+    # Refill the window (and the tiers, as far as it reaches) from the tail
+    # of the log, e.g. after a reset. Without a backup RTC the clock
+    # restarts at 2021-01-01 on reset, so the log can hold stamps later
+    # than now or than the records after them. Walking back from now, such
+    # a record and all before it are shifted to end one interval before
+    # the next one, which keeps the restored times sorted.
+    def restore(self):
+        if self.log is None:
+            return
+        records = list(self.log.tail(self.count_max))
+        shift = 0
+        next_t = time()
+        for i in range(len(records) - 1, -1, -1):
+            t, value = records[i]
+            t += shift
+            if t > next_t:
+                shift += next_t - self.interval - t
+                t = next_t - self.interval
+                records[i] = (t, value)
+            elif shift:
+                records[i] = (t, value)
+            next_t = t
+        for t, value in records:
+            self._push(value, t)
+            self.last_value = value
+        self._publish()
 
-        # 全期間での平均を計算
-        self.average_whole = ((len(self.commited_data)-1) * self.average_whole +
-                              self.average) / len(self.commited_data)
+    def _push(self, value, t):
+        data = self.commited_data
+        if len(data) == data.capacity:
+            d = data[0] - self.shift  # Falls out of the window
+            self.sum -= d
+            self.sum_sq -= d * d
+        data.append(value)
+        self.commit_times.append(t)
+        seq = self.seq
+        self.seq += 1
+        self.window_max.expire(seq - self.count_max + 1)
+        self.window_min.expire(seq - self.count_max + 1)
+        self.window_max.push(seq, value)
+        self.window_min.push(seq, value)
+        if seq % self.count_max == 0:
+            self._rebuild_sums()
+        else:
+            d = value - self.shift
+            self.sum += d
+            self.sum_sq += d * d
+
+        for tier in self.tiers.values():
+            tier.add(value, t)
+
+        # 窓内の平均・標準偏差を計算
+        n = len(data)
+        mean = self.sum / n
+        self.average_whole = self.shift + mean
+        self.stddev = math.sqrt(max(0, self.sum_sq / n - mean * mean))
         # 平均値からスケールを計算
         self.scale = GetScale(self.average_whole)
 
-    def get_data(self):
-        return self.commited_data
+    def _rebuild_sums(self):
+        data = self.commited_data
+        self.shift = data[-1]
+        self.sum = 0
+        self.sum_sq = 0
+        for value in data:
+            d = value - self.shift
+            self.sum += d
+            self.sum_sq += d * d
+
+    # The committed values, or the means of a rollup tier ('hour'/'day'),
+    # as a RingBuffer, oldest first
+    def get_data(self, tier=None):
+        if tier is None:
+            return self.commited_data
+        return self.tiers[tier].mean
+
+    # Commit times matching get_data(tier), oldest first
+    def get_times(self, tier=None):
+        if tier is None:
+            return self.commit_times
+        return self.tiers[tier].times
+
+    # Index range [i0, i1) of get_data(tier) committed in t0 <= t < t1,
+    # found by binary search over the commit times. These never decrease:
+    # if the clock runs backwards, commits keep the last commit time until
+    # it catches up, so they are drawn at that time.
+    def slice(self, t0, t1, tier=None):
+        times = self.get_times(tier)
+        return bisect(times, t0), bisect(times, t1)
 
 
 if __name__ == '__main__':
@@ -61,4 +443,5 @@ if __name__ == '__main__':
         for i in range(0, 3):
             datac.add()
         datac.commit()
-    print(datac.get_data())  # [2.0, 5.0, 8.0]
+    print(list(datac.get_data()))  # [2.0, 5.0, 8.0]
+    print(list(datac.snapshot().get_data()), datac.snapshot().max)  # [2.0, 5.0, 8.0] 8.0
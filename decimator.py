@@ -0,0 +1,98 @@
+# Decimation of a chart series that has more points than pixel columns.
+# Both functions work on pixel coordinates xs/ys (sorted by x) and compact
+# the points start <= i < end in place to dst, dst <= start, so runs of a
+# series can be packed one after another. They return the new end (dst
+# plus the number of points kept). O(n), nothing is allocated per point.
+
+
+# Per pixel column keep the first, lowest, highest and last point (M4).
+# The polyline through them covers the same pixels as through all points,
+# so spikes stay visible.
+def minmax(xs, ys, start, end, dst):
+    i = start
+    while i < end:
+        x = xs[i]
+        lo = hi = i
+        j = i + 1
+        while j < end and xs[j] == x:
+            if ys[j] < ys[lo]:
+                lo = j
+            elif ys[j] > ys[hi]:
+                hi = j
+            j += 1
+        last = j - 1
+        if lo > hi:
+            lo, hi = hi, lo
+        y_first = ys[i]
+        y_lo = ys[lo]
+        y_hi = ys[hi]
+        y_last = ys[last]
+        xs[dst] = x
+        ys[dst] = y_first
+        dst += 1
+        if lo != i:
+            xs[dst] = x
+            ys[dst] = y_lo
+            dst += 1
+        if hi != lo:
+            xs[dst] = x
+            ys[dst] = y_hi
+            dst += 1
+        if last != hi:
+            xs[dst] = x
+            ys[dst] = y_last
+            dst += 1
+        i = j
+    return dst
+
+
+# Largest-Triangle-Three-Buckets: keep the first and last point and, from
+# each of threshold - 2 buckets in between, the point forming the largest
+# triangle with the point kept before it and the mean of the next bucket.
+# Areas are compared scaled by the next bucket's size to stay in integers.
+def lttb(xs, ys, start, end, threshold, dst):
+    n = end - start
+    if threshold < 3 or threshold >= n:
+        for i in range(start, end):
+            xs[dst] = xs[i]
+            ys[dst] = ys[i]
+            dst += 1
+        return dst
+    buckets = threshold - 2
+    inner = n - 2
+    ax = xs[start]
+    ay = ys[start]
+    last_x = xs[end - 1]
+    last_y = ys[end - 1]
+    xs[dst] = ax
+    ys[dst] = ay
+    dst += 1
+    b0 = start + 1
+    for k in range(buckets):
+        b1 = start + 1 + (k + 1) * inner // buckets
+        # Mean of the next bucket (the last point after the last bucket)
+        c1 = start + 1 + (k + 2) * inner // buckets if k + 1 < buckets else end
+        sx = 0
+        sy = 0
+        for j in range(b1, c1):
+            sx += xs[j]
+            sy += ys[j]
+        count = c1 - b1
+        dx = ax * count - sx
+        dy = sy - ay * count
+        best = -1
+        for j in range(b0, b1):
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > best:
+                best = area
+                bx = xs[j]
+                by = ys[j]
+        xs[dst] = bx
+        ys[dst] = by
+        dst += 1
+        ax = bx
+        ay = by
+        b0 = b1
+    xs[dst] = last_x
+    ys[dst] = last_y
+    return dst + 1
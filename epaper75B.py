@@ -11,7 +11,11 @@
 
 from machine import Pin, SPI
 import framebuf
+import micropython
+import ubinascii
+import uasyncio as asyncio
 import utime
+from array import array
 import font.writer
 
 # Display resolution
@@ -23,6 +27,41 @@ DC_PIN = 8
 CS_PIN = 9
 BUSY_PIN = 13
 
+# Rows streamed per SPI write when a plane has to be converted on the fly
+CHUNK_ROWS = 16
+
+# Controller init sequences as (command, data) pairs, see send_table()
+POWER_ON_TABLE = (
+    # btst. If an exception is displayed, try using 0x38 for the 3rd byte
+    (b'\x06', b'\x17\x17\x28\x17'),
+    # POWER SETTING (unused): 07 07 3f 3f, VGH=20V,VGL=-20V, VDH/VDL=+-15V
+    (b'\x04', b''),                   # POWER ON
+)
+PANEL_INIT_TABLE = (
+    (b'\x00', b'\x0f'),              # PANNEL SETTING: KW-3f KWR-2F BWROTP 0f BWOTP 1f
+    (b'\x61', b'\x03\x20\x01\xe0'),  # tres: source 800, gate 480
+    (b'\x15', b'\x00'),
+    (b'\x50', b'\x11\x07'),          # VCOM AND DATA INTERVAL SETTING
+    (b'\x60', b'\x22'),              # TCON SETTING
+    (b'\x65', b'\x00\x00\x00\x00'),  # Resolution setting 800*480
+)
+
+
+# dst[i] = ~src[offset + i], one 32-bit word at a time
+@micropython.viper
+def _invert_words(dst: ptr32, src: ptr32, offset: int, count: int):
+    for i in range(count):
+        dst[i] = src[offset + i] ^ -1
+
+
+# True when src[offset:offset + count] (32-bit words) is all zero
+@micropython.viper
+def _blank_words(src: ptr32, offset: int, count: int) -> bool:
+    for i in range(offset, offset + count):
+        if src[i]:
+            return False
+    return True
+
 
 def timed_function(f, *args, **kwargs):
     myname = str(f).split(' ')[1]
@@ -40,6 +79,8 @@ class EPD_7in5_B:
     WHITE = 0x00
     BLACK = 0xff
     RED = 0xff
+    # Partial updates allowed between two full refreshes (ghosting limit)
+    full_refresh_interval = 10
 
     def __init__(self):
         self.reset_pin = Pin(RST_PIN, Pin.OUT)
@@ -55,6 +96,11 @@ class EPD_7in5_B:
 
         self.buffer_balck = bytearray(self.height * self.width // 8)
         self.buffer_red = bytearray(self.height * self.width // 8)
+        # Scratch buffer for the inverted black plane, reused every display()
+        self.chunk = bytearray(self.width // 8 * CHUNK_ROWS)
+        # Constant chunks streamed for blank spans and by the Clear helpers
+        self.chunk_00 = bytes(len(self.chunk))
+        self.chunk_ff = b'\xff' * len(self.chunk)
         self.imageblack = font.writer.Display(
             self.buffer_balck, self.width, self.height, framebuf.MONO_HLSB)
         self.imagered = font.writer.Display(
@@ -64,6 +110,14 @@ class EPD_7in5_B:
         self.writer_black.wrap = False
         self.writer_red = font.writer.Writer(self.imagered, "hgn")
         self.writer_red.wrap = False
+        # CRC32 per CHUNK_ROWS band of both planes as last sent to the panel
+        self.band_crc = array('I', [0] * (self.height // CHUNK_ROWS))
+        self.pending_crc = array('I', self.band_crc)
+        self.pending_range = (0, 0)
+        self.skipped_count = 0
+        self.partial = False
+        self.invalidate()
+        self.powered = False  # True between init() and sleep()
         self.init()
 
     def digital_write(self, pin, value):
@@ -80,6 +134,7 @@ class EPD_7in5_B:
 
     def module_exit(self):
         self.digital_write(self.reset_pin, 0)
+        self.powered = False
 
     # Hardware reset
     def reset(self):
@@ -90,6 +145,14 @@ class EPD_7in5_B:
         self.digital_write(self.reset_pin, 1)
         self.delay_ms(200)
 
+    async def reset_async(self):
+        self.digital_write(self.reset_pin, 1)
+        await asyncio.sleep_ms(200)
+        self.digital_write(self.reset_pin, 0)
+        await asyncio.sleep_ms(2)
+        self.digital_write(self.reset_pin, 1)
+        await asyncio.sleep_ms(200)
+
     def send_command(self, command):
         self.digital_write(self.dc_pin, 0)
         self.digital_write(self.cs_pin, 0)
@@ -102,6 +165,52 @@ class EPD_7in5_B:
         self.spi_writebyte([data])
         self.digital_write(self.cs_pin, 1)
 
+    # Send a command table in one transaction: CS stays low, only DC
+    # toggles between each command byte and its data.
+    def send_table(self, table):
+        self.digital_write(self.cs_pin, 0)
+        for command, data in table:
+            self.digital_write(self.dc_pin, 0)
+            self.spi.write(command)
+            if data:
+                self.digital_write(self.dc_pin, 1)
+                self.spi.write(data)
+        self.digital_write(self.cs_pin, 1)
+
+    # Stream buf[start:end] (default: the whole plane) with DC/CS asserted
+    # once. invert=True sends ~buf (black plane) through self.chunk without
+    # allocating; start and end must then be multiples of len(self.chunk).
+    # Blank chunks are not inverted, the constant 0xff chunk is sent instead.
+    def send_data_buffer(self, buf, invert=False, start=0, end=None):
+        if end is None:
+            end = len(buf)
+        self.digital_write(self.dc_pin, 1)
+        self.digital_write(self.cs_pin, 0)
+        if not invert:
+            if start == 0 and end == len(buf):
+                self.spi.write(buf)
+            else:
+                self.spi.write(memoryview(buf)[start:end])
+        else:
+            chunk = self.chunk
+            words = len(chunk) // 4
+            for offset in range(start // 4, end // 4, words):
+                if _blank_words(buf, offset, words):
+                    self.spi.write(self.chunk_ff)
+                else:
+                    _invert_words(chunk, buf, offset, words)
+                    self.spi.write(chunk)
+        self.digital_write(self.cs_pin, 1)
+
+    # Stream a whole plane of a constant byte (0x00 or 0xff).
+    def send_data_fill(self, value):
+        chunk = self.chunk_ff if value else self.chunk_00
+        self.digital_write(self.dc_pin, 1)
+        self.digital_write(self.cs_pin, 0)
+        for _ in range(len(self.buffer_red) // len(chunk)):
+            self.spi.write(chunk)
+        self.digital_write(self.cs_pin, 1)
+
     def WaitUntilIdle(self):
         print("e-Paper busy")
         while(self.digital_read(self.busy_pin) == 0):   # Wait until the busy_pin goes LOW
@@ -109,142 +218,239 @@ class EPD_7in5_B:
         self.delay_ms(20)
         print("e-Paper busy release")
 
+    # Same as WaitUntilIdle, but lets other uasyncio tasks run meanwhile
+    async def WaitUntilIdleAsync(self):
+        print("e-Paper busy")
+        while(self.digital_read(self.busy_pin) == 0):
+            await asyncio.sleep_ms(20)
+        await asyncio.sleep_ms(20)
+        print("e-Paper busy release")
+
     def TurnOnDisplay(self):
         self.send_command(0x12)  # DISPLAY REFRESH
         self.delay_ms(100)  # !!!The delay here is necessary, 200uS at least!!!
         self.WaitUntilIdle()
 
+    async def TurnOnDisplayAsync(self):
+        self.send_command(0x12)  # DISPLAY REFRESH
+        await asyncio.sleep_ms(100)
+        await self.WaitUntilIdleAsync()
+
+    # No-op while the controller is still powered up from a previous init();
+    # only deep sleep needs the hardware reset again.
     def init(self):
+        if self.powered:
+            return 0
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x06)     # btst
-        self.send_data(0x17)
-        self.send_data(0x17)
-        # If an exception is displayed, try using 0x38
-        self.send_data(0x28)
-        self.send_data(0x17)
-
-#         self.send_command(0x01)  # POWER SETTING
-#         self.send_data(0x07)
-#         self.send_data(0x07)     # VGH=20V,VGL=-20V
-#         self.send_data(0x3f)     # VDH=15V
-#         self.send_data(0x3f)     # VDL=-15V
-
-        self.send_command(0x04)  # POWER ON
+        self.power_on()
         self.delay_ms(100)
         self.WaitUntilIdle()
+        self.init_panel()
+        return 0
 
-        self.send_command(0X00)   # PANNEL SETTING
-        self.send_data(0x0F)      # KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x61)     # tres
-        self.send_data(0x03)     # source 800
-        self.send_data(0x20)
-        self.send_data(0x01)     # gate 480
-        self.send_data(0xE0)
-
-        self.send_command(0X15)
-        self.send_data(0x00)
-
-        self.send_command(0X50)     # VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x11)
-        self.send_data(0x07)
-
-        self.send_command(0X60)     # TCON SETTING
-        self.send_data(0x22)
-
-        self.send_command(0x65)     # Resolution setting
-        self.send_data(0x00)
-        self.send_data(0x00)     # 800*480
-        self.send_data(0x00)
-        self.send_data(0x00)
-
+    async def init_async(self):
+        if self.powered:
+            return 0
+        await self.reset_async()
+        self.power_on()
+        await asyncio.sleep_ms(100)
+        await self.WaitUntilIdleAsync()
+        self.init_panel()
         return 0
 
-    def Clear(self):
+    # Booster soft start and POWER ON. Wait for busy before init_panel().
+    def power_on(self):
+        self.send_table(POWER_ON_TABLE)
 
-        high = self.height
-        if(self.width % 8 == 0):
-            wide = self.width // 8
-        else:
-            wide = self.width // 8 + 1
+    def init_panel(self):
+        self.send_table(PANEL_INIT_TABLE)
+        self.powered = True
 
+    def Clear(self):
         self.send_command(0x10)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(0xff)
+        self.send_data_fill(0xff)
 
         self.send_command(0x13)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(0x00)
+        self.send_data_fill(0x00)
 
+        self.invalidate()
         self.TurnOnDisplay()
 
     def ClearRed(self):
-
-        high = self.height
-        if(self.width % 8 == 0):
-            wide = self.width // 8
-        else:
-            wide = self.width // 8 + 1
-
         self.send_command(0x10)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(0xff)
+        self.send_data_fill(0xff)
 
         self.send_command(0x13)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(0xff)
+        self.send_data_fill(0xff)
 
+        self.invalidate()
         self.TurnOnDisplay()
 
     def ClearBlack(self):
-
-        high = self.height
-        if(self.width % 8 == 0):
-            wide = self.width // 8
-        else:
-            wide = self.width // 8 + 1
-
         self.send_command(0x10)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(0x00)
+        self.send_data_fill(0x00)
 
         self.send_command(0x13)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(0x00)
+        self.send_data_fill(0x00)
 
+        self.invalidate()
         self.TurnOnDisplay()
 
-    def display(self):
+    # Rows [y0, y1) touched on either plane since the last display(),
+    # widened to CHUNK_ROWS boundaries. None when nothing was drawn.
+    def dirty_band(self):
+        y0 = self.height
+        y1 = 0
+        for image in (self.imageblack, self.imagered):
+            if image.dirty is not None:
+                y0 = min(y0, image.dirty[1])
+                y1 = max(y1, image.dirty[3])
+        if y0 >= y1:
+            return None
+        y0 -= y0 % CHUNK_ROWS
+        y1 += -y1 % CHUNK_ROWS
+        return y0, min(y1, self.height)
+
+    # Forget what the panel shows: the next display() is a full refresh.
+    def invalidate(self):
+        self.partial_count = self.full_refresh_interval
+        self.crc_valid = False
+
+    # Rows [y0, y1) whose content differs from what was last sent, or None
+    # when the frame is unchanged. Only bands inside dirty_band() are hashed.
+    def changed_band(self):
+        if self.crc_valid:
+            band = self.dirty_band()
+            if band is None:
+                return None
+        else:
+            band = (0, self.height)
+        size = self.width // 8 * CHUNK_ROWS
+        black = memoryview(self.buffer_balck)
+        red = memoryview(self.buffer_red)
+        first = -1
+        last = -1
+        lo = band[0] // CHUNK_ROWS
+        hi = band[1] // CHUNK_ROWS
+        for n in range(lo, hi):
+            start = n * size
+            crc = ubinascii.crc32(black[start:start + size])
+            crc = ubinascii.crc32(red[start:start + size], crc)
+            self.pending_crc[n] = crc
+            if not self.crc_valid or crc != self.band_crc[n]:
+                if first < 0:
+                    first = n
+                last = n
+        self.pending_range = (lo, hi)
+        if first < 0:
+            return None
+        return first * CHUNK_ROWS, (last + 1) * CHUNK_ROWS
+
+    # Send the changed part of the frame to the controller RAM without
+    # refreshing. Returns the uploaded row band, or None when nothing
+    # changed since the last upload.
+    def upload(self):
+        return self.upload_band(self.changed_band())
+
+    # upload() for the band already returned by changed_band()
+    def upload_band(self, band):
         self.imageblack.show()
         self.imagered.show()
 
-        high = self.height
-        if(self.width % 8 == 0):
-            wide = self.width // 8
+        self.imageblack.clear_dirty()
+        self.imagered.clear_dirty()
+        if band is None:
+            self.skipped_count += 1
+            print('display skipped: frame unchanged ({} skipped)'.format(
+                self.skipped_count))
+            return None
+
+        if(band == (0, self.height) or
+           self.partial_count >= self.full_refresh_interval):
+            self.partial_count = 0
+            self.partial = False
+            # send black data
+            self.send_command(0x10)
+            self.send_data_buffer(self.buffer_balck, True)
+
+            # send red data
+            self.send_command(0x13)
+            self.send_data_buffer(self.buffer_red)
         else:
-            wide = self.width // 8 + 1
+            self.partial_count += 1
+            self.partial = True
+            self.upload_partial(band[0], band[1])
+        for n in range(self.pending_range[0], self.pending_range[1]):
+            self.band_crc[n] = self.pending_crc[n]
+        self.crc_valid = True
+        return band
+
+    # Upload only the full-width row band [y0, y1) in partial mode.
+    def upload_partial(self, y0, y1):
+        print('partial update rows {}-{}'.format(y0, y1))
+        wide = self.width // 8
+        self.send_command(0x91)  # PARTIAL IN
+        self.send_command(0x90)  # PARTIAL WINDOW
+        self.send_data(0x00)     # x start 0
+        self.send_data(0x00)
+        self.send_data((self.width - 1) >> 8)  # x end
+        self.send_data((self.width - 1) & 0xff)
+        self.send_data(y0 >> 8)  # y start
+        self.send_data(y0 & 0xff)
+        self.send_data((y1 - 1) >> 8)  # y end
+        self.send_data((y1 - 1) & 0xff)
+        self.send_data(0x01)     # gates scan both inside and outside
 
-        # send black data
         self.send_command(0x10)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(~self.buffer_balck[i + j * wide])
-
-        # send red data
+        self.send_data_buffer(self.buffer_balck, True, y0 * wide, y1 * wide)
         self.send_command(0x13)
-        for j in range(0, high):
-            for i in range(0, wide):
-                self.send_data(self.buffer_red[i + j * wide])
+        self.send_data_buffer(self.buffer_red, False, y0 * wide, y1 * wide)
 
+    # Returns the refreshed row band, or None when the refresh was skipped
+    # because nothing changed since the last upload.
+    def display(self):
+        band = self.upload()
+        if band is not None:
+            self.TurnOnDisplay()
+            if self.partial:
+                self.send_command(0x92)  # PARTIAL OUT
+        return band
+
+    async def display_async(self):
+        band = self.upload()
+        if band is not None:
+            await self.TurnOnDisplayAsync()
+            if self.partial:
+                self.send_command(0x92)  # PARTIAL OUT
+        return band
+
+    # Whole cycle for a frame already drawn into the planes:
+    # init -> upload -> refresh -> deep sleep. The panel is left asleep when
+    # the frame matches the last upload.
+    def refresh(self):
+        band = self.changed_band()
+        if band is None:
+            return self.upload_band(None)  # only records the skip
+        self.init()
+        self.upload_band(band)
         self.TurnOnDisplay()
+        if self.partial:
+            self.send_command(0x92)  # PARTIAL OUT
+        self.sleep()
+        return band
+
+    async def refresh_async(self):
+        band = self.changed_band()
+        if band is None:
+            return self.upload_band(None)
+        await self.init_async()
+        self.upload_band(band)
+        await self.TurnOnDisplayAsync()
+        if self.partial:
+            self.send_command(0x92)  # PARTIAL OUT
+        await self.sleep_async()
+        return band
 
     def sleep(self):
         self.delay_ms(2000)
@@ -253,6 +459,16 @@ class EPD_7in5_B:
         self.WaitUntilIdle()
         self.send_command(0x07)  # deep sleep
         self.send_data(0xa5)
+        self.powered = False
+
+    async def sleep_async(self):
+        await asyncio.sleep_ms(2000)
+        print("sleep")
+        self.send_command(0x02)  # power off
+        await self.WaitUntilIdleAsync()
+        self.send_command(0x07)  # deep sleep
+        self.send_data(0xa5)
+        self.powered = False
 
     def display_sample(self):
         self.imageblack.fill(0xff)
@@ -286,6 +502,16 @@ class EPD_7in5_B:
 
 
 if __name__ == '__main__':
+    import gc
     epd = EPD_7in5_B()
     epd.init()
     epd.display_sample()
+    # Measure display() alone: the drawing above is not counted
+    epd.invalidate()
+    gc.collect()
+    mem = gc.mem_alloc()
+    t = utime.ticks_us()
+    epd.display()
+    delta = utime.ticks_diff(utime.ticks_us(), t)
+    used = gc.mem_alloc() - mem
+    print('display {:6.3f}ms, allocated {} bytes'.format(delta/1000, used))
@@ -0,0 +1,129 @@
+# binfont.py Binary font container for Writer.
+# Holds the same glyph data as a font_to_py module, but glyphs are read from
+# the file on demand instead of importing every bitmap into RAM.
+
+# Layout (little endian):
+#   header  HEADER: magic, version, flags, height, max_width, baseline,
+#           min_ch, max_ch, number of index entries
+#   index   INDEX_ENTRY per character: code point, glyph offset. Sorted by
+#           code point, offsets are relative to the glyph data.
+#   glyphs  per glyph: width (uint16) then the bitmap rows as in font_to_py.
+#           The default glyph is at offset 0.
+# flags: bit 0 hmap, bit 1 reverse, bit 2 monospaced.
+
+# Convert an existing module (on the host or the Pico):
+#   python -m font.binfont font/hgn/40b.py font/hgn/40b.bin
+# A .bin file next to a module is picked up by Writer.fonts instead of it.
+
+import struct
+
+MAGIC = b'HGNF'
+VERSION = 1
+HEADER = '<4sBBHHHIII'
+INDEX_ENTRY = '<II'
+
+
+class BinFont():
+    def __init__(self, path, cache_size=32):
+        self.file = open(path, 'rb')
+        header = self.file.read(struct.calcsize(HEADER))
+        (magic, version, flags, self._height, self._max_width, self._baseline,
+         self._min_ch, self._max_ch, self.count) = struct.unpack(HEADER, header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a binary font: ' + path)
+        self.flags = flags
+        self.index_start = len(header)
+        self.entry_size = struct.calcsize(INDEX_ENTRY)
+        self.data_start = self.index_start + self.count * self.entry_size
+        self.entry = bytearray(self.entry_size)  # Reused by _find()
+        self.cache_size = cache_size
+        self.cache = {}  # code point: (glyph, height, width)
+        self.order = []  # Cached code points, oldest first
+
+    def height(self):
+        return self._height
+
+    def baseline(self):
+        return self._baseline
+
+    def max_width(self):
+        return self._max_width
+
+    def hmap(self):
+        return bool(self.flags & 1)
+
+    def reverse(self):
+        return bool(self.flags & 2)
+
+    def monospaced(self):
+        return bool(self.flags & 4)
+
+    def min_ch(self):
+        return self._min_ch
+
+    def max_ch(self):
+        return self._max_ch
+
+    def get_ch(self, ch):
+        code = ord(ch)
+        glyph = self.cache.get(code)
+        if glyph is None:
+            glyph = self._read(self._find(code))
+            if len(self.order) >= self.cache_size:
+                del self.cache[self.order.pop(0)]
+            self.cache[code] = glyph
+            self.order.append(code)
+        return glyph
+
+    def close(self):
+        self.file.close()
+        self.cache = {}
+        self.order = []
+
+    # Binary search of the index on file. Returns the glyph offset, 0 (the
+    # default glyph) when the code point is missing.
+    def _find(self, code):
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            m = (lo + hi) // 2
+            self.file.seek(self.index_start + m * self.entry_size)
+            self.file.readinto(self.entry)
+            v, offset = struct.unpack(INDEX_ENTRY, self.entry)
+            if v == code:
+                return offset
+            if v < code:
+                lo = m + 1
+            else:
+                hi = m
+        return 0
+
+    def _read(self, offset):
+        self.file.seek(self.data_start + offset)
+        width = struct.unpack('<H', self.file.read(2))[0]
+        size = ((width - 1) // 8 + 1) * self._height if width else 0
+        return memoryview(self.file.read(size)), self._height, width
+
+
+# Write the font_to_py module at src as a binary font at dst
+def pack(src, dst):
+    font = {}
+    with open(src) as f:
+        exec(f.read(), font)
+    sparse = font['_sparse']
+    count = len(sparse) // 4
+    flags = ((1 if font['hmap']() else 0) | (2 if font['reverse']() else 0) |
+             (4 if font['monospaced']() else 0))
+    with open(dst, 'wb') as f:
+        f.write(struct.pack(HEADER, MAGIC, VERSION, flags, font['height'](),
+                            font['max_width'](), font['baseline'](),
+                            font['min_ch'](), font['max_ch'](), count))
+        for i in range(count):
+            code, offset = struct.unpack('<HH', sparse[i * 4:i * 4 + 4])
+            f.write(struct.pack(INDEX_ENTRY, code, offset))
+        f.write(font['_font'])
+
+
+if __name__ == '__main__':
+    import sys
+    pack(sys.argv[1], sys.argv[2])
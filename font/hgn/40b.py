@@ -209,20 +209,21 @@ _mvfont = memoryview(_font)
 _mvsp = memoryview(_sparse)
 ifb = lambda l : l[0] | (l[1] << 8)
 
-def bs(lst, val):
-    while True:
-        m = (len(lst) & ~ 7) >> 1
-        v = ifb(lst[m:])
-        if v == val:
-            return ifb(lst[m + 2:])
-        if not m:
-            return 0
-        lst = lst[m:] if v < val else lst[:m]
-
-def get_ch(ch):
-    doff = bs(_mvsp, ord(ch))
+def _glyph(doff):
     width = ifb(_mvfont[doff : ])
-
     next_offs = doff + 2 + ((width - 1)//8 + 1) * 40
     return _mvfont[doff + 2:next_offs], 40, width
- 
+
+# Direct index over min_ch()..max_ch(), built once at import. Characters
+# missing from the font map to the default glyph at offset 0.
+_min = min_ch()
+_default = _glyph(0)
+_glyphs = [_default] * (max_ch() - _min + 1)
+for _i in range(0, len(_sparse), 4):
+    _glyphs[ifb(_mvsp[_i:]) - _min] = _glyph(ifb(_mvsp[_i + 2:]))
+
+def get_ch(ch):
+    oc = ord(ch) - _min
+    if 0 <= oc < len(_glyphs):
+        return _glyphs[oc]
+    return _default
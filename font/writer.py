@@ -20,23 +20,240 @@
 # 10 pixel high font, timings were 1.76ms/396μs, gain 4.36 (arial10).
 
 import framebuf
+import gc
+import os
+import sys
+import utime
+from font.binfont import BinFont
 
 __version__ = (0, 5, 0)
 
 fast_mode = True  # Does nothing. Kept to avoid breaking code.
 
+# Directory holding the font families (font/<family>/<size>[b].py|.bin)
+FONT_DIR = globals().get('__file__', 'font/writer.py').rsplit('/', 1)[0]
 
+
+# Display tracks the bounding box touched by drawing calls since the last
+# clear_dirty() as [x0, y0, x1, y1) in self.dirty (None when untouched).
 class Display(framebuf.FrameBuffer):
     def __init__(self, buffer, width, height, mode):
         self.buffer = buffer
         self.width = width
         self.height = height
         self.mode = mode
+        self.dirty = None
         super().__init__(self.buffer, self.width, self.height, self.mode)
 
     def show(self):
         ...
 
+    def mark_dirty(self, x, y, w, h):
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + w, self.width)
+        y1 = min(y + h, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        d = self.dirty
+        if d is None:
+            self.dirty = [x0, y0, x1, y1]
+        else:
+            d[0] = min(d[0], x0)
+            d[1] = min(d[1], y0)
+            d[2] = max(d[2], x1)
+            d[3] = max(d[3], y1)
+
+    def clear_dirty(self):
+        self.dirty = None
+
+    def fill(self, c):
+        self.mark_dirty(0, 0, self.width, self.height)
+        super().fill(c)
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return super().pixel(x, y)
+        self.mark_dirty(x, y, 1, 1)
+        super().pixel(x, y, c)
+
+    def hline(self, x, y, w, c):
+        self.mark_dirty(x, y, w, 1)
+        super().hline(x, y, w, c)
+
+    def vline(self, x, y, h, c):
+        self.mark_dirty(x, y, 1, h)
+        super().vline(x, y, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        self.mark_dirty(min(x1, x2), min(y1, y2),
+                        abs(x2 - x1) + 1, abs(y2 - y1) + 1)
+        super().line(x1, y1, x2, y2, c)
+
+    def rect(self, x, y, w, h, c):
+        self.mark_dirty(x, y, w, h)
+        super().rect(x, y, w, h, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        self.mark_dirty(x, y, w, h)
+        super().fill_rect(x, y, w, h, c)
+
+    def text(self, s, x, y, c=1):
+        self.mark_dirty(x, y, len(s) * 8, 8)
+        super().text(s, x, y, c)
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        # A plain FrameBuffer does not expose its size: assume it covers
+        # the whole screen unless it is a Sprite/Display.
+        w = getattr(fbuf, 'width', self.width)
+        h = getattr(fbuf, 'height', self.height)
+        self.mark_dirty(x, y, w, h)
+        if palette is None:
+            super().blit(fbuf, x, y, key)
+        else:
+            super().blit(fbuf, x, y, key, palette)
+
+    def scroll(self, xstep, ystep):
+        self.mark_dirty(0, 0, self.width, self.height)
+        super().scroll(xstep, ystep)
+
+
+# FrameBuffer that remembers its size so Display.blit can track it.
+class Sprite(framebuf.FrameBuffer):
+    def __init__(self, buffer, width, height, mode):
+        self.width = width
+        self.height = height
+        super().__init__(buffer, width, height, mode)
+
+
+# LRU cache of ready-to-blit Sprites (glyphs or whole labels), bounded by
+# the bytes of bitmap data it holds. hits/misses/used are kept for tuning.
+class SpriteCache():
+    def __init__(self, budget=8192):
+        self.budget = budget
+        self.entries = {}  # key: [sprite, size, last use]
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.tick = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.tick += 1
+        entry[2] = self.tick
+        return entry[0]
+
+    def put(self, key, sprite, size):
+        if size > self.budget:
+            return
+        while self.used + size > self.budget:
+            self.evict()
+        self.tick += 1
+        self.entries[key] = [sprite, size, self.tick]
+        self.used += size
+
+    # Drop the least recently used entry
+    def evict(self):
+        entries = self.entries
+        oldest = min(entries, key=lambda k: entries[k][2])
+        self.used -= entries.pop(oldest)[1]
+
+    def clear(self):
+        self.entries = {}
+        self.used = 0
+
+    # Drop every entry whose key satisfies match(key)
+    def discard(self, match):
+        for key in [k for k in self.entries if match(k)]:
+            self.used -= self.entries.pop(key)[1]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'bytes': self.used, 'entries': len(self.entries)}
+
+
+# Process-wide table of fonts shared by all Writers. A font is loaded on
+# first use and stays resident until unload(). A binary font (binfont.py)
+# next to the module is preferred: it reads glyphs from flash on demand.
+# stats holds the load time (us) and heap growth (bytes) of each font.
+class FontRegistry():
+    def __init__(self):
+        self.fonts = {}  # (family, size, bold): module
+        self.width_tables = {}  # (family, size, bold): {char: widths}
+        self.stats = {}  # (family, size, bold): (load us, bytes)
+
+    @staticmethod
+    def module_name(family, size, bold=False):
+        name = 'font.' + family + '.' + str(size)
+        return name + 'b' if bold else name
+
+    def get(self, family, size, bold=False):
+        font = self.fonts.get((family, size, bold))
+        if font is None:
+            font = self.load(family, size, bold)
+        return font
+
+    # Per-font cache of character widths, filled in by Writer._widths()
+    def width_table(self, family, size, bold=False):
+        key = (family, size, bold)
+        table = self.width_tables.get(key)
+        if table is None:
+            table = self.width_tables[key] = {}
+        return table
+
+    def load(self, family, size, bold=False):
+        key = (family, size, bold)
+        name = self.module_name(family, size, bold)
+        gc.collect()
+        mem = gc.mem_alloc()
+        t = utime.ticks_us()
+        path = '{}/{}/{}{}.bin'.format(FONT_DIR, family, size, 'b' if bold else '')
+        try:
+            os.stat(path)
+        except OSError:
+            path = None
+        if path is None:
+            __import__(name)
+            font = sys.modules[name]
+        else:
+            font = BinFont(path)
+        self.stats[key] = (utime.ticks_diff(utime.ticks_us(), t),
+                           gc.mem_alloc() - mem)
+        self.fonts[key] = font
+        return font
+
+    # Forget a font so its bitmaps can be collected. Writers currently set
+    # to that font keep it alive until they change size.
+    def unload(self, family, size, bold=False):
+        font = self.fonts.pop((family, size, bold), None)
+        if font is None:
+            return
+        self.width_tables.pop((family, size, bold), None)
+        if isinstance(font, BinFont):
+            font.close()
+        name = self.module_name(family, size, bold)
+        if name in sys.modules:
+            del sys.modules[name]
+        package = sys.modules.get(name.rsplit('.', 1)[0])
+        try:
+            delattr(package, name.rsplit('.', 1)[1])
+        except (AttributeError, TypeError):
+            pass
+        Writer.glyph_cache.discard(lambda k: k[0] is font)
+        Writer.text_cache.discard(
+            lambda k: k[0] == family and k[2] == size and k[3] == bold)
+        gc.collect()
+
+    def report(self):
+        for key, (us, size) in self.stats.items():
+            print('font {}: load {:6.3f}ms, {} bytes{}'.format(
+                self.module_name(*key), us / 1000, size,
+                '' if key in self.fonts else ' (unloaded)'))
+
 
 class DisplayState():
     def __init__(self):
@@ -52,10 +269,35 @@ def _get_id(device):
 # Basic Writer class for monochrome displays
 
 
+# Printable width of a glyph less any blank columns on RHS
+def _truelen(glyph, ht, wd):
+    div, mod = divmod(wd, 8)
+    gbytes = div + 1 if mod else div  # No. of bytes per row of glyph
+    mc = 0  # Max non-blank column
+    data = glyph[(wd - 1) // 8]  # Last byte of row 0
+    for row in range(ht):  # Glyph row
+        for col in range(wd - 1, -1, -1):  # Glyph column
+            gbyte, gbit = divmod(col, 8)
+            if gbit == 0:  # Next glyph byte
+                data = glyph[row * gbytes + gbyte]
+            if col <= mc:
+                break
+            if data & (1 << (7 - gbit)):  # Pixel is lit (1)
+                mc = col  # Eventually gives rightmost lit pixel
+                break
+        if mc + 1 == wd:
+            break  # All done: no trailing space
+    return mc + 1
+
+
 class Writer():
 
     state = {}  # Holds a display state for each device
+    glyph_cache = SpriteCache()  # Shared by all Writers
+    text_cache = SpriteCache(6144)  # Pre-rendered labels, see text_sprite()
+    fonts = FontRegistry()  # Shared by all Writers
     fontSize = 0
+    fontBold = False
 
     @staticmethod
     def set_textpos(device: Display, row=None, col=None):
@@ -108,13 +350,12 @@ class Writer():
         self.clip_width = 0
 
     def _change_font_size(self, size: int, bold=False):
-        if(self.fontSize == size):
+        if(self.fontSize == size and self.fontBold == bold):
             return
         self.fontSize = size
-        fontfile = 'font.'+self.fontFamily+'.'+str(size)
-        if(bold):
-            fontfile = fontfile+'b'
-        self.font = __import__(fontfile, globals(), locals(), [], 0)
+        self.fontBold = bold
+        self.font = Writer.fonts.get(self.fontFamily, size, bold)
+        self.widths = Writer.fonts.width_table(self.fontFamily, size, bold)
 
     def _getstate(self) -> DisplayState:
         return Writer.state[self.devid]
@@ -150,7 +391,7 @@ class Writer():
         self._change_font_size(fontSize, bold)
         s = self._getstate()
         if rightFit:
-            x -= len(text)*fontSize
+            x -= self.measure(text, fontSize, bold)
         s.text_col = x
         s.text_row = y
         self.printstring(text)
@@ -191,39 +432,40 @@ class Writer():
         wd = self.screenwidth
         l = 0
         for char in string[:-1]:
-            _, _, char_width = self.font.get_ch(char)
-            l += char_width
+            l += self._widths(char)[0]
             if oh and l + sc > wd:
                 return True  # All done. Save time.
-        char = string[-1]
-        _, _, char_width = self.font.get_ch(char)
+        char_width, true_width = self._widths(string[-1])
         if oh and l + sc + char_width > wd:
-            l += self._truelen(char)  # Last char might have blank cols on RHS
+            l += true_width  # Last char might have blank cols on RHS
         else:
             l += char_width  # Public method. Return same value as old code.
         return l + sc > wd if oh else l
 
+    # Printed width of text in pixels: advance widths of all but the last
+    # char plus the last char less its blank columns on RHS.
+    def measure(self, text: str, fontSize=24, bold=False):
+        self._change_font_size(fontSize, bold)
+        if not text:
+            return 0
+        l = 0
+        for char in text[:-1]:
+            l += self._widths(char)[0]
+        return l + self._widths(text[-1])[1]
+
+    # (advance width, width less blank columns on RHS) of a char, from the
+    # current font's width table.
+    def _widths(self, char):
+        w = self.widths.get(char)
+        if w is None:
+            glyph, ht, wd = self.font.get_ch(char)
+            w = (wd, _truelen(glyph, ht, wd))
+            self.widths[char] = w
+        return w
+
     # Return the printable width of a glyph less any blank columns on RHS
     def _truelen(self, char):
-        glyph, ht, wd = self.font.get_ch(char)
-        div, mod = divmod(wd, 8)
-        gbytes = div + 1 if mod else div  # No. of bytes per row of glyph
-        mc = 0  # Max non-blank column
-        data = glyph[(wd - 1) // 8]  # Last byte of row 0
-        for row in range(ht):  # Glyph row
-            for col in range(wd - 1, -1, -1):  # Glyph column
-                gbyte, gbit = divmod(col, 8)
-                if gbit == 0:  # Next glyph byte
-                    data = glyph[row * gbytes + gbyte]
-                if col <= mc:
-                    break
-                if data & (1 << (7 - gbit)):  # Pixel is lit (1)
-                    mc = col  # Eventually gives rightmost lit pixel
-                    break
-            if mc + 1 == wd:
-                break  # All done: no trailing space
-        # print('Truelen', char, wd, mc + 1)  # TEST
-        return mc + 1
+        return self._widths(char)[1]
 
     def _get_char(self, char, recurse):
         if not recurse:  # Handle tabs
@@ -270,16 +512,59 @@ class Writer():
         self._get_char(char, recurse)
         if self.glyph is None:
             return  # All done
-        buf = bytearray(self.glyph)
-        if invert:
-            for i, v in enumerate(buf):
-                buf[i] = 0xFF & ~ v
-        fbc = framebuf.FrameBuffer(
-            buf, self.clip_width, self.char_height, self.map)
+        fbc = self._glyph_sprite(
+            char, self.glyph, self.clip_width, self.char_height, invert)
         self.device.blit(fbc, s.text_col, s.text_row, 0x00)
         s.text_col += self.char_width
         self.cpos += 1
 
+    def _glyph_sprite(self, char, glyph, width, height, invert=False):
+        key = (self.font, char, invert, width)
+        fbc = Writer.glyph_cache.get(key)
+        if fbc is None:
+            buf = bytearray(glyph)
+            if invert:
+                for i, v in enumerate(buf):
+                    buf[i] = 0xFF & ~ v
+            fbc = Sprite(buf, width, height, self.map)
+            Writer.glyph_cache.put(key, fbc, len(buf))
+        return fbc
+
+    # Like text(), for single-line labels that repeat between frames: the
+    # whole string is rendered once into a cached Sprite, so later calls
+    # cost one blit. No wrap, tab or newline handling.
+    def text_sprite(self, text: str, x: int, y: int, fontSize=24, bold=False, rightFit=False):
+        self._change_font_size(fontSize, bold)
+        key = (self.fontFamily, text, fontSize, bold)
+        sprite = Writer.text_cache.get(key)
+        if sprite is None:
+            sprite = self._render_sprite(text)
+            if sprite is None:
+                return
+            Writer.text_cache.put(
+                key, sprite, (sprite.width + 7) // 8 * sprite.height)
+        if rightFit:
+            x -= self.measure(text, fontSize, bold)
+        self.device.blit(sprite, x, y, 0)
+        s = self._getstate()
+        s.text_col = x + sprite.width
+        s.text_row = y
+
+    def _render_sprite(self, text):
+        width = self.stringlen(text)
+        if width == 0:
+            return None
+        height = self.font.height()
+        sprite = Sprite(bytearray((width + 7) // 8 * height),
+                        width, height, framebuf.MONO_HLSB)
+        col = 0
+        for char in text:
+            glyph, char_height, char_width = self.font.get_ch(char)
+            sprite.blit(self._glyph_sprite(
+                char, glyph, char_width, char_height), col, 0, 0)
+            col += char_width
+        return sprite
+
     def tabsize(self, value=None):
         if value is not None:
             self.tab = value
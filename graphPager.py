@@ -1,43 +1,130 @@
 import framebuf
 import math
+from array import array
 from epaper75B import EPD_7in5_B
-from dataCollector import DataCollector
+from dataCollector import DataCollector, Snapshot
+import decimator
+from font.writer import Sprite, SpriteCache
 import utime
 
 
-def circle(buf: framebuf.FrameBuffer, point, r, c):
+# Point markers, rendered once per (shape, r, color) into a (2r+1)^2
+# Sprite and stamped with blit. Shapes: 'circle', 'ring', 'square' and
+# 'triangle'.
+marker_cache = SpriteCache(2048)
+
+
+def marker(shape, r, c):
+    key = (shape, r, c)
+    sprite = marker_cache.get(key)
+    if sprite is None:
+        size = 2*r + 1
+        buf = bytearray((size + 7) // 8 * size)
+        sprite = Sprite(buf, size, size, framebuf.MONO_HLSB)
+        bg = 0 if c else 1  # Transparent colour for blit
+        sprite.fill(bg)
+        if shape == 'circle' or shape == 'ring':
+            _disc(sprite, r, r, c)
+            if shape == 'ring':
+                _disc(sprite, r, r - max(1, r // 3), bg)
+        elif shape == 'square':
+            sprite.fill_rect(1, 1, size - 2, size - 2, c)
+        elif shape == 'triangle':
+            for j in range(size):
+                sprite.hline(r - j//2, j, 2*(j//2) + 1, c)
+        else:
+            raise ValueError('Unknown marker: ' + shape)
+        marker_cache.put(key, sprite, len(buf))
+    return sprite
+
+
+def draw_marker(buf: framebuf.FrameBuffer, point, shape, r, c):
     x, y = point
-    buf.hline(x-r, y, r*2, c)
-    for i in range(1, r):
-        a = int(math.sqrt(r*r-i*i))  # Pythagoras!
-        buf.hline(x-a, y+i, a*2, c)  # Lower half
-        buf.hline(x-a, y-i, a*2, c)  # Upper half
+    buf.blit(marker(shape, r, c), x - r, y - r, 0 if c else 1)
+
+
+# Filled disc of radius r centred on (r, r) (pixels within r + 1/2)
+def _disc(buf, r, a, c):
+    for i in range(-a, a+1):
+        w = int(math.sqrt(a*a + a - i*i))
+        buf.hline(r - w, r + i, 2*w + 1, c)
+
 
+# Joins the points (xs[i], ys[i]), start <= i < end, with a w pixel wide
+# line. Each segment follows Bresenham's line, widened across to w pixels
+# (offsets -w//2 .. w-1-w//2). Steps on the same row (column for steep
+# segments) are drawn as one fill_rect, so a segment sets each of its
+# pixels once and costs one call per row/column. The shared vertex is
+# drawn once when both segments are steep or both are not; otherwise its
+# vertical and horizontal cross-sections are both drawn.
+def polyline_w(buf: framebuf.FrameBuffer, xs, ys, w, c, start=0, end=None):
+    if end is None:
+        end = len(xs)
+    o = w // 2
+    x1 = xs[start]
+    y1 = ys[start]
+    steep = None
+    for i in range(start + 1, end):
+        x2 = xs[i]
+        y2 = ys[i]
+        steep = _segment_w(buf, x1, y1, x2, y2, w, o, c, steep)
+        x1, y1 = x2, y2
 
-def line_w(buf: framebuf.FrameBuffer, point1, point2, w, c):
-    x1, y1 = point1
-    x2, y2 = point2
-    for i in range(-1*int(w/2), int(w/2)):
-        for j in range(-1*int(w/2), int(w/2)):
-            buf.line(x1+i, y1+j, x2+i, y2+j, c)
+
+# One segment of polyline_w(). prev_steep is the steepness of the segment
+# ending at (x1, y1), None for the first one. Returns its own steepness.
+def _segment_w(buf, x1, y1, x2, y2, w, o, c, prev_steep):
+    steep = abs(y2 - y1) > abs(x2 - x1)
+    # 前の線分が同じ向きなら始点の断面は塗り済み
+    skip_first = steep == prev_steep
+    if steep:  # y を主軸 (a)、x を副軸 (b) にする
+        x1, y1, x2, y2 = y1, x1, y2, x2
+    da = abs(x2 - x1)
+    db = abs(y2 - y1)
+    sa = 1 if x2 >= x1 else -1
+    sb = 1 if y2 >= y1 else -1
+    a = x1
+    b = y1
+    err = da // 2
+    left = da + 1  # Pixels of the centre line still to draw
+    while left:
+        # Steps until err goes negative, i.e. until b moves
+        k = err // db + 1 if db else left
+        if k > left:
+            k = left
+        start = a
+        n = k
+        if skip_first:
+            start += sa
+            n -= 1
+            skip_first = False
+        if n:
+            lo = start if sa > 0 else start - n + 1
+            if steep:
+                buf.fill_rect(b - o, lo, w, n, c)
+            else:
+                buf.fill_rect(lo, b - o, n, w, c)
+        a += sa * k
+        left -= k
+        err += da - k * db
+        b += sb
+    return steep
 
 
 class GraphData:
-    def __init__(self, data: DataCollector, cell_height, offset):
+    def __init__(self, data: Snapshot, cell_height, offset, tier=None):
         self.data = data
-        self.unit = (self.data.max - self.data.min) / 2
-        self.max = math.ceil(self.data.max + self.unit)
+        self.values = data.get_data(tier)
+        self.times = data.get_times(tier)
+        source = data if tier is None else data.tiers[tier]
+        self.unit = (source.max - source.min) / 2
+        self.max = math.ceil(source.max + self.unit)
         if(self.unit == 0):
             self.height_per_unit = 0
             self.zero_y = 0
         else:
             self.height_per_unit = cell_height/self.unit
             self.zero_y = int(offset+cell_height * (self.max/self.unit))
-        self.last_pos = (0, 0)
-
-    def get_pos(self, x, value):
-        self.last_pos = (x, int(self.zero_y-(self.height_per_unit*value)))
-        return self.last_pos
 
     def round(self, value):
         return round(value, 3-self.data.scale)
@@ -56,44 +143,114 @@ class GraphPaper:
     column_now = -1
     now_pos = column_count + column_now
 
-    def __init__(self, data1: DataCollector, data2: DataCollector, data_interval: int):
-        self.data_count_per_hour = int((60*60)/data_interval)
-        self.data_count_per_cell = self.hours_per_cell * self.data_count_per_hour
-        self.width_per_data = self.cell_width/self.data_count_per_cell
+    # Marker (shape, radius) of data1/data2, see marker(). Markers closer
+    # than marker_gap pixels to the previous one are skipped.
+    marker1 = ('circle', 5)
+    marker2 = ('circle', 5)
+    marker_gap = 4
+
+    # Thinning of series with more points than pixel columns: 'minmax'
+    # (keeps spikes), 'lttb' (keeps the shape, one point per column) or
+    # None to plot every point. See decimator.py.
+    decimation = 'minmax'
+
+    # Hours per grid cell for each view: raw commits (18h), hourly rollups
+    # (9 days) and daily rollups (36 days)
+    tier_hours_per_cell = {None: 2, 'hour': 24, 'day': 96}
+
+    # data_interval is the commit interval of data1/data2 in seconds. tier
+    # selects the rollup tier of DataCollector to draw instead of the raw
+    # commits.
+    def __init__(self, data1: DataCollector, data2: DataCollector, data_interval: int, tier=None):
+        self.tier = tier
+        self.hours_per_cell = self.tier_hours_per_cell[tier]
+        if tier is not None:
+            data_interval *= data1.tiers[tier].period
+        self.data_interval = data_interval
+        self.seconds_per_pixel = self.hours_per_cell*60*60 / self.cell_width
         self.epd = EPD_7in5_B()
         self.data1 = data1
         self.data2 = data2
+        # Pixel coordinates of the visible points, reused between series
+        # and frames (grown when needed), see map_points()
+        self.xs = array('i')
+        self.ys = array('i')
+        self.breaks = []
+        # Pre-rendered grid, see restore_background()
+        self.background = None
+        self.background_key = None
+        self.last_key = None  # Data of the last frame, see unchanged()
 
+    # Skipped (nothing drawn or sent) while the data shown is the same as
+    # in the last frame, see unchanged().
     def display(self):
-        self.epd.init()
+        if self.unchanged():
+            return
+        self.render()
+        self.epd.refresh()
+
+    # Same as display(), but the panel's busy periods yield to other
+    # uasyncio tasks.
+    async def display_async(self):
+        if self.unchanged():
+            return
+        self.render()
+        await self.epd.refresh_async()
+
+    # True when no value was committed and the header values round the
+    # same as in the last frame. The clock and the x positions still move,
+    # but redrawing the panel for them alone is not worth a refresh.
+    def unchanged(self):
+        snapshot1 = self.data1.snapshot()
+        snapshot2 = self.data2.snapshot()
+        key = (snapshot1.seq, snapshot2.seq) + self.header_values(snapshot1, snapshot2)
+        if key == self.last_key:
+            self.epd.skipped_count += 1
+            print('display skipped: data unchanged ({} skipped)'.format(
+                self.epd.skipped_count))
+            return True
+        self.last_key = key
+        return False
+
+    # Voltage and temperature as shown in the header
+    def header_values(self, snapshot1, snapshot2):
+        return (round(self.data2.last_value, 3 - snapshot1.scale),
+                round(self.data1.last_value, 3 - snapshot2.scale))
+
+    # Reads one snapshot of each DataCollector, so commits made meanwhile
+    # by the sensor thread do not mix into the chart. The header shows the
+    # latest sample, a single attribute that is read atomically.
+    def render(self):
+        snapshot1 = self.data1.snapshot()
+        snapshot2 = self.data2.snapshot()
         self.series1 = GraphData(
-            self.data1, self.cell_height, self.margin_top)
+            snapshot1, self.cell_height, self.margin_top, self.tier)
         self.series2 = GraphData(
-            self.data2, self.cell_height, self.margin_top)
-        self.epd.imageblack.fill(self.epd.WHITE)
+            snapshot2, self.cell_height, self.margin_top, self.tier)
+        self.restore_background()
         self.epd.imagered.fill(self.epd.WHITE)
+        voltage, temperature = self.header_values(snapshot1, snapshot2)
         t = utime.localtime()
         self.epd.writer_black.text('{:04d}/{:02d}/{:02d} {:02d}:{:02d}:{:02d}'.format(
             t[0], t[1], t[2], t[3], t[4], t[5]), 10, 10, 40, True)
         self.epd.writer_black.text(
-            str(self.series1.round(self.data2.last_value))+'V', 500, 10, 40, True)
+            str(voltage)+'V', 500, 10, 40, True)
         self.epd.writer_red.text(
-            str(self.series2.round(self.data1.last_value))+chr(176)+'C', 630, 10, 40, True)
+            str(temperature)+chr(176)+'C', 630, 10, 40, True)
         self.plot()
-        self.epd.display()
-        self.epd.sleep()
 
+    # Points are placed by commit time: the "now" grid line is the current
+    # time and the chart reaches now_pos cells back. Each series is mapped
+    # to pixels once, then drawn as markers and polylines. Points further
+    # apart than two intervals (missed commits) are not joined.
     def plot(self):
         self.draw_frame()
-        for i in range(0, self.column_count*self.data_count_per_cell+1):
-            if i > self.now_pos*self.data_count_per_cell:
-                continue
-            x = int(self.margin_left+i*self.width_per_data)
-            index = self.now_pos*self.data_count_per_cell - i
-            self.plot_series(self.series1, index, x, 1)
-            self.plot_series(self.series2, index, x, 2)
-
-    def plot_series(self, series: GraphData, index, x, color):
+        now = utime.time()
+        t0 = now - int(self.now_pos*self.cell_width*self.seconds_per_pixel)
+        self.plot_series(self.series1, t0, now, 1, self.marker1)
+        self.plot_series(self.series2, t0, now, 2, self.marker2)
+
+    def plot_series(self, series: GraphData, t0, now, color, marker=('circle', 5)):
         if(color == 1):
             display = self.epd.imagered
             color = self.epd.RED
@@ -101,45 +258,166 @@ class GraphPaper:
             display = self.epd.imageblack
             color = self.epd.BLACK
 
-        data = series.data.get_data()
-        if len(data) <= index:
-            return
-        value = data[(len(data)-1)-index]
-        last_pos = series.last_pos
-        point = series.get_pos(x, value)
-        circle(display, point, 5, color)
-        if(last_pos[0] != 0):
-            line_w(display, last_pos, point, 2, color)
+        i0, i1 = series.data.slice(t0, now + 1, self.tier)
+        n = self.map_points(series, i0, i1, now)
+        if self.decimation is not None:
+            n = self.decimate(n)
+        xs = self.xs
+        ys = self.ys
+        shape, r = marker
+        last_marker_x = None
+        for i in range(n):
+            x = xs[i]
+            if(last_marker_x is None or x - last_marker_x >= self.marker_gap):
+                draw_marker(display, (x, ys[i]), shape, r, color)
+                last_marker_x = x
+        start = 0
+        self.breaks.append(n)
+        for end in self.breaks:
+            if end - start > 1:
+                polyline_w(display, xs, ys, 2, color, start, end)
+            start = end
 
-    def draw_frame(self):
+    # Decimate each run of self.xs/self.ys (n points) that has more points
+    # than the pixel columns it spans, in place, and shift self.breaks to
+    # match. Returns the new number of points.
+    def decimate(self, n):
+        if n < 3:
+            return n
+        xs = self.xs
+        ys = self.ys
+        breaks = self.breaks
+        start = 0
+        dst = 0
+        for k in range(len(breaks) + 1):
+            end = breaks[k] if k < len(breaks) else n
+            if k:
+                breaks[k - 1] = dst
+            columns = xs[end - 1] - xs[start] + 1
+            if end - start <= columns:
+                for i in range(start, end):
+                    xs[dst] = xs[i]
+                    ys[dst] = ys[i]
+                    dst += 1
+            elif self.decimation == 'lttb':
+                dst = decimator.lttb(xs, ys, start, end, columns, dst)
+            else:
+                dst = decimator.minmax(xs, ys, start, end, dst)
+            start = end
+        return dst
+
+    # Map points i0 <= i < i1 of series to pixels in self.xs/self.ys in one
+    # pass over the ring storage. Returns the number of points; self.breaks
+    # gets the indexes that start a new run after missed commits.
+    def map_points(self, series: GraphData, i0, i1, now):
+        n = i1 - i0
+        if len(self.xs) < n:
+            self.xs = array('i', [0] * n)
+            self.ys = array('i', [0] * n)
+        xs = self.xs
+        ys = self.ys
+        breaks = self.breaks = []
+        values = series.values
+        times = series.times
+        vdata = values.data
+        tdata = times.data
+        vsize = values.size
+        tsize = times.size
+        vj = values.start + i0
+        if vj >= vsize:
+            vj -= vsize
+        tj = times.start + i0
+        if tj >= tsize:
+            tj -= tsize
+        x_now = self.margin_left + self.now_pos*self.cell_width
+        seconds_per_pixel = self.seconds_per_pixel
+        zero_y = series.zero_y
+        height_per_unit = series.height_per_unit
+        max_gap = 2*self.data_interval
+        last_t = None
+        for i in range(n):
+            t = tdata[tj]
+            xs[i] = x_now - int((now - t) / seconds_per_pixel)
+            ys[i] = int(zero_y - height_per_unit*vdata[vj])
+            if(last_t is not None and t - last_t > max_gap):
+                breaks.append(i)
+            last_t = t
+            vj += 1
+            if vj == vsize:
+                vj = 0
+            tj += 1
+            if tj == tsize:
+                tj = 0
+        return n
+
+    # Clear the black plane to the static grid. The grid depends only on
+    # the layout, so one row of cells of it (with its top line) and the
+    # bottom line are rendered once into self.background; each frame
+    # copies them into the plane and clears the rest, instead of a full
+    # fill and redrawing every grid line.
+    def restore_background(self):
+        image = self.epd.imageblack
+        key = (image.width, self.margin_left, self.margin_top, self.cell_width,
+               self.cell_height, self.column_count, self.row_count, self.width)
+        if key != self.background_key:
+            self.build_background()
+            self.background_key = key
+        stride = image.width // 8
+        band = stride * self.cell_height
+        top = self.margin_top
+        bottom = top + self.row_count*self.cell_height  # Bottom line row
+        background = self.background
+        buffer = memoryview(image.buffer)
+        image.fill_rect(0, 0, image.width, top, self.epd.WHITE)
+        offset = top * stride
+        for i in range(self.row_count):
+            buffer[offset:offset + band] = background[:band]
+            offset += band
+        buffer[offset:offset + stride] = background[band:]
+        image.fill_rect(0, bottom + 1, image.width,
+                        image.height - bottom - 1, self.epd.WHITE)
+        image.mark_dirty(0, top, image.width, bottom + 1 - top)
+
+    def build_background(self):
+        image = self.epd.imageblack
+        rows = self.cell_height + 1
+        buffer = bytearray(image.width // 8 * rows)
+        layer = framebuf.FrameBuffer(
+            buffer, image.width, rows, framebuf.MONO_HLSB)
         # 横線
-        for i in range(0, self.row_count+1):
-            self.epd.imageblack.hline(
-                self.margin_left, self.margin_top+self.cell_height*i, self.width, self.epd.BLACK)
+        layer.hline(self.margin_left, 0, self.width, self.epd.BLACK)
+        layer.hline(self.margin_left, rows - 1, self.width, self.epd.BLACK)
         # 縦線
         for i in range(0, self.column_count+1):
-            self.epd.imageblack.vline(
-                self.margin_left+self.cell_width*i, self.margin_top, self.height, self.epd.BLACK)
+            layer.vline(self.margin_left+self.cell_width*i,
+                        0, rows - 1, self.epd.BLACK)
+        self.background = memoryview(buffer)
+
+    # Axis labels; the grid itself comes from restore_background()
+    def draw_frame(self):
         # Y軸 ラベル
         for i in range(0, self.row_count+1):
             value1 = self.series1.max - i*self.series1.unit
-            self.epd.writer_black.text(
+            self.epd.writer_black.text_sprite(
                 str(self.series1.round(value1)), 8, self.margin_top+self.cell_height*i-10)
             value2 = self.series2.max - i*self.series2.unit
-            self.epd.writer_black.text(str(self.series2.round(value2)), self.width+8,
-                                       self.margin_top+self.cell_height*i-10, rightFit=True)
+            self.epd.writer_black.text_sprite(str(self.series2.round(value2)), self.width+8,
+                                              self.margin_top+self.cell_height*i-10, rightFit=True)
         # X軸 ラベル
-        t = utime.localtime()
-        hour = t[3]
+        now = utime.time()
+        t = utime.localtime(now)
         for i in range(0, self.column_count+1):
-            value = hour-(self.now_pos-i)*self.hours_per_cell
-            if value < 0:
-                value += 24
-            elif value > 24:
-                value -= 24
-            if value != hour:
-                self.epd.writer_black.text(str(value), self.margin_left +
-                                           self.cell_width*i-12, self.margin_top - 30)
+            offset = (self.now_pos-i)*self.hours_per_cell*60*60
+            if offset != 0:
+                tc = utime.localtime(now - offset)
+                x = self.margin_left + self.cell_width*i
+                if self.hours_per_cell < 24:
+                    self.epd.writer_black.text_sprite(
+                        str(tc[3]), x-12, self.margin_top - 30)
+                else:
+                    label = '{}/{}'.format(tc[1], tc[2])
+                    self.epd.writer_black.text_sprite(
+                        label, x - self.epd.writer_black.measure(label)//2, self.margin_top - 30)
             else:
                 self.epd.writer_red.text('{:02d}:{:02d}'.format(
                     t[3], t[4]), self.margin_left +
@@ -154,13 +432,13 @@ if __name__ == '__main__':
         global count1
         count1 += 1
         return count1
-    data1 = DataCollector(get1, 'A')
+    data1 = DataCollector(get1, 'A', interval=60*10)
 
     def get2():
         global count2
         count2 += 1
         return count2*count2
-    data2 = DataCollector(get2, 'B')
+    data2 = DataCollector(get2, 'B', interval=60*10)
 
     for i in range(0, 5):
         data1.add()
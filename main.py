@@ -2,25 +2,35 @@
 from utime import time, sleep
 from thermometer import Thermometer
 from battery import Battery
+from adcSampler import AdcSampler
 import _thread
 from dataCollector import DataCollector
+from sampleLog import SampleLog
 from graphPager import GraphPaper
 
-interval_get_value = 20
+interval_get_value = 60
 interval_commit_value = 60*10
 interval_display = 60*20
 
 if __name__ == '__main__':
-    thermometer = Thermometer()
-    temp_date = DataCollector(thermometer.get)
+    # Both sensors are oversampled in one pass per wake-up
+    sampler = AdcSampler()
 
-    battery = Battery()
-    soc_data = DataCollector(battery.getVoltage)
+    thermometer = Thermometer(sampler)
+    temp_date = DataCollector(thermometer.value, interval=interval_commit_value,
+                              log=SampleLog('log', 'temp'))
+    temp_date.restore()
+
+    battery = Battery(sampler)
+    soc_data = DataCollector(battery.voltage, interval=interval_commit_value,
+                             log=SampleLog('log', 'battery'))
+    soc_data.restore()
 
     def update_data():
         last_display_time = time()
         while True:
             now = time()
+            sampler.read()
             temp_date.add()
             soc_data.add()
             if(now - last_display_time >= interval_commit_value):
@@ -38,8 +48,10 @@ if __name__ == '__main__':
     graph = GraphPaper(temp_date, soc_data, interval_commit_value)
     while True:
         print('start display')
-        print('temp:{}, {}'.format(temp_date.get_data(), temp_date.scale))
-        print('battery:{}, {}'.format(soc_data.get_data(), soc_data.scale))
+        temp = temp_date.snapshot()
+        soc = soc_data.snapshot()
+        print('temp:{}, {}'.format(list(temp.get_data()), temp.scale))
+        print('battery:{}, {}'.format(list(soc.get_data()), soc.scale))
         graph.display()
         print('end display')
         sleep(interval_display)
@@ -0,0 +1,104 @@
+import os
+import struct
+
+# Fixed-size record: commit time (seconds), committed value
+RECORD = '<if'
+RECORD_SIZE = struct.calcsize(RECORD)
+
+
+# Append-only log of committed samples on flash, split into numbered
+# segment files <directory>/<name>.<n>.log of up to segment_records records.
+# Only the newest `segments` files are kept. Records are buffered in RAM and
+# written `batch` at a time to limit flash wear; call flush() before a
+# planned shutdown. tail() reads only the end of the newest segments, so
+# resuming after a reset does not replay the whole history.
+class SampleLog:
+    def __init__(self, directory, name, segment_records=1024, segments=4, batch=6):
+        self.directory = directory
+        self.name = name
+        self.segment_records = segment_records
+        self.segments = segments
+        self.batch = batch
+        self.pending = bytearray(batch * RECORD_SIZE)
+        self.pending_count = 0
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass  # Already exists
+        numbers = self.segment_numbers()
+        self.segment = numbers[-1] if numbers else 0
+        self.segment_count = self.records_in(self.segment)
+
+    def path(self, n):
+        return '{}/{}.{}.log'.format(self.directory, self.name, n)
+
+    # Numbers of the segment files on flash, oldest first
+    def segment_numbers(self):
+        prefix = self.name + '.'
+        numbers = []
+        for file in os.listdir(self.directory):
+            if file.startswith(prefix) and file.endswith('.log'):
+                n = file[len(prefix):-4]
+                if n.isdigit():
+                    numbers.append(int(n))
+        numbers.sort()
+        return numbers
+
+    # Complete records in segment n (a torn last record is ignored)
+    def records_in(self, n):
+        try:
+            return os.stat(self.path(n))[6] // RECORD_SIZE
+        except OSError:
+            return 0
+
+    def append(self, t, value):
+        struct.pack_into(RECORD, self.pending,
+                         self.pending_count * RECORD_SIZE, t, value)
+        self.pending_count += 1
+        if self.pending_count == self.batch:
+            self.flush()
+
+    def flush(self):
+        written = 0
+        while written < self.pending_count:
+            if self.segment_count == self.segment_records:
+                self.rotate()
+            n = min(self.pending_count - written,
+                    self.segment_records - self.segment_count)
+            with open(self.path(self.segment), 'ab') as f:
+                f.write(memoryview(self.pending)[
+                    written * RECORD_SIZE:(written + n) * RECORD_SIZE])
+            self.segment_count += n
+            written += n
+        self.pending_count = 0
+
+    def rotate(self):
+        self.segment += 1
+        self.segment_count = 0
+        for n in self.segment_numbers():
+            if n <= self.segment - self.segments:
+                os.remove(self.path(n))
+
+    # Yield the newest `count` records as (t, value), oldest first,
+    # including records not flushed yet.
+    def tail(self, count):
+        skip = max(0, self.pending_count - count)  # Unwanted pending records
+        count -= self.pending_count - skip
+        # Walk back from the newest segment to find where to start reading
+        reads = []
+        for n in reversed(self.segment_numbers()):
+            if count <= 0:
+                break
+            records = self.records_in(n)
+            take = min(count, records)
+            reads.append((n, records - take, take))
+            count -= take
+        record = bytearray(RECORD_SIZE)
+        for n, start, take in reversed(reads):
+            with open(self.path(n), 'rb') as f:
+                f.seek(start * RECORD_SIZE)
+                for _ in range(take):
+                    f.readinto(record)
+                    yield struct.unpack(RECORD, record)
+        for i in range(skip, self.pending_count):
+            yield struct.unpack_from(RECORD, self.pending, i * RECORD_SIZE)
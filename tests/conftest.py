@@ -0,0 +1,23 @@
+# Host tests run on CPython: the MicroPython modules the code imports
+# (machine, framebuf, micropython, utime, uasyncio, ubinascii) are replaced
+# by the stand-ins in tests/fakes, and the repo root is put on the path.
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'fakes'))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import sitecustomize  # noqa: E402,F401  (gc.mem_alloc)
+import machine  # noqa: E402  (the stand-in)
+import utime  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def hardware():
+    machine.reset()
+    utime.now[0] = utime.EPOCH
+    yield
+    machine.reset()
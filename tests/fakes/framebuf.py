@@ -0,0 +1,94 @@
+# CPython stand-in for MicroPython's framebuf: the drawing primitives the
+# code uses, pixel by pixel, for the monochrome formats. text() draws
+# nothing (the built-in 8x8 font is not emulated).
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+
+class FrameBuffer:
+    def __init__(self, buf, width, height, mode, stride=None):
+        self._buf = buf
+        self._w = width
+        self._h = height
+        self._mode = mode
+        self._stride = (width + 7) // 8
+
+    def _bit(self, x):
+        if self._mode == MONO_HLSB:
+            return 0x80 >> (x & 7)
+        return 1 << (x & 7)
+
+    def _set(self, x, y, c):
+        if 0 <= x < self._w and 0 <= y < self._h:
+            i = y * self._stride + (x >> 3)
+            if c:
+                self._buf[i] |= self._bit(x)
+            else:
+                self._buf[i] &= ~self._bit(x) & 0xff
+
+    def _get(self, x, y):
+        return 1 if self._buf[y * self._stride + (x >> 3)] & self._bit(x) else 0
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            if 0 <= x < self._w and 0 <= y < self._h:
+                return self._get(x, y)
+            return None
+        self._set(x, y, c)
+
+    def fill(self, c):
+        v = 0xff if c else 0
+        for i in range(len(self._buf)):
+            self._buf[i] = v
+
+    def fill_rect(self, x, y, w, h, c):
+        for yy in range(max(y, 0), min(y + h, self._h)):
+            for xx in range(max(x, 0), min(x + w, self._w)):
+                self._set(xx, yy, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        dx = abs(x2 - x1)
+        sx = 1 if x1 < x2 else -1
+        dy = -abs(y2 - y1)
+        sy = 1 if y1 < y2 else -1
+        err = dx + dy
+        while True:
+            self._set(x1, y1, c)
+            if x1 == x2 and y1 == y2:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x1 += sx
+            if e2 <= dx:
+                err += dx
+                y1 += sy
+
+    def blit(self, src, x, y, key=-1, palette=None):
+        for yy in range(src._h):
+            for xx in range(src._w):
+                c = src._get(xx, yy)
+                if c != key:
+                    self._set(x + xx, y + yy, c)
+
+    def scroll(self, xstep, ystep):
+        pass
+
+    def text(self, s, x, y, c=1):
+        pass
@@ -0,0 +1,61 @@
+# CPython stand-in for MicroPython's machine module, see conftest.py.
+# While `record` is set, pin writes and SPI writes are appended to `trace`
+# as ('pin', number, value) and ('spi', bytes), so tests can replay the
+# wire. Input pins read Pin.inputs (a value or a callable), default 1.
+
+trace = []
+record = True
+
+
+def reset():
+    global record
+    del trace[:]
+    record = True
+    Pin.inputs = {}
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+    inputs = {}
+
+    def __init__(self, n, mode=-1, pull=-1):
+        self.n = n
+        self.v = 0
+
+    def value(self, v=None):
+        if v is None:
+            v = Pin.inputs.get(self.n, 1)
+            return v() if callable(v) else v
+        self.v = v
+        if record:
+            trace.append(('pin', self.n, v))
+
+    def irq(self, handler=None, trigger=None):
+        self.handler = handler
+
+
+class SPI:
+    def __init__(self, n):
+        self.writes = 0
+
+    def init(self, **kwargs):
+        pass
+
+    def write(self, buf):
+        self.writes += 1
+        if record:
+            trace.append(('spi', bytes(buf)))
+
+
+class ADC:
+    CORE_TEMP = 4
+
+    def __init__(self, n):
+        self.n = n
+
+    def read_u16(self):
+        return 0x8000
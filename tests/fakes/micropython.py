@@ -0,0 +1,37 @@
+# CPython stand-in for the micropython module. viper functions run as
+# plain Python: ptr32/ptr8 arguments are passed as memoryviews of words or
+# bytes, so pointer indexing behaves as on the Pico.
+import builtins
+import functools
+import inspect
+
+builtins.ptr8 = 'ptr8'
+builtins.ptr16 = 'ptr16'
+builtins.ptr32 = 'ptr32'
+builtins.uint = int
+
+
+def viper(f):
+    annotations = f.__annotations__
+    names = list(inspect.signature(f).parameters)
+
+    @functools.wraps(f)
+    def wrapper(*args):
+        converted = []
+        for name, v in zip(names, args):
+            kind = annotations.get(name)
+            if kind == 'ptr32':
+                v = memoryview(v).cast('B').cast('i')
+            elif kind == 'ptr8':
+                v = memoryview(v).cast('B')
+            converted.append(v)
+        return f(*converted)
+    return wrapper
+
+
+def native(f):
+    return f
+
+
+def const(x):
+    return x
@@ -0,0 +1,7 @@
+# Imported at startup when tests/fakes is on PYTHONPATH (bench scripts on
+# the host), and by conftest.py: CPython's gc has no mem_alloc/mem_free.
+import gc
+
+if not hasattr(gc, 'mem_alloc'):
+    gc.mem_alloc = lambda: 0
+    gc.mem_free = lambda: 0
@@ -0,0 +1,8 @@
+# CPython stand-in for uasyncio. sleep_ms() only yields to the other
+# tasks, so tests do not wait for the panel's real busy periods.
+from asyncio import *  # noqa: F401,F403
+import asyncio as _asyncio
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(0)
@@ -0,0 +1,34 @@
+# CPython stand-in for MicroPython's utime. time() is the fake clock
+# now[0], which tests advance; sleeps return at once.
+import time as _time
+
+EPOCH = 1700000000
+now = [EPOCH]
+
+
+def time():
+    return now[0]
+
+
+def sleep(s):
+    pass
+
+
+def sleep_ms(ms):
+    pass
+
+
+def ticks_us():
+    return int(_time.perf_counter() * 1000000)
+
+
+def ticks_ms():
+    return int(_time.perf_counter() * 1000)
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def localtime(t=None):
+    return _time.gmtime(now[0] if t is None else t)[:8]
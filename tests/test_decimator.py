@@ -0,0 +1,72 @@
+import random
+from array import array
+
+import decimator
+
+
+# n points sorted by x, several per pixel column
+def random_series(rnd, n):
+    xs = []
+    x = rnd.randint(0, 10)
+    for _ in range(n):
+        xs.append(x)
+        x += rnd.choice((0, 0, 0, 1, 2))
+    ys = [rnd.randint(0, 300) for _ in range(n)]
+    return xs, ys
+
+
+# {x: [y, ...]} in point order
+def columns(xs, ys):
+    result = {}
+    for x, y in zip(xs, ys):
+        result.setdefault(x, []).append(y)
+    return result
+
+
+# True when the points (xs, ys) appear in order in (all_xs, all_ys)
+def subsequence(xs, ys, all_xs, all_ys):
+    points = iter(zip(all_xs, all_ys))
+    return all(p in points for p in zip(xs, ys))
+
+
+def test_minmax_keeps_first_last_lowest_highest():
+    rnd = random.Random(7)
+    for _ in range(500):
+        n = rnd.randint(1, 200)
+        xs, ys = random_series(rnd, n)
+        pad = rnd.randint(0, 5)  # Points before start, packed over to dst
+        dst = rnd.randint(0, pad)
+        bx = array('i', [-1] * pad + xs)
+        by = array('i', [-1] * pad + ys)
+        end = decimator.minmax(bx, by, pad, pad + n, dst)
+        kept_xs = list(bx[dst:end])
+        kept_ys = list(by[dst:end])
+
+        assert subsequence(kept_xs, kept_ys, xs, ys)
+        before = columns(xs, ys)
+        after = columns(kept_xs, kept_ys)
+        assert list(after) == list(before)
+        for x, column in before.items():
+            kept = after[x]
+            assert len(kept) <= 4
+            assert kept[0] == column[0]
+            assert kept[-1] == column[-1]
+            assert min(kept) == min(column)
+            assert max(kept) == max(column)
+
+
+def test_lttb_keeps_threshold_points_and_ends():
+    rnd = random.Random(11)
+    for _ in range(200):
+        n = rnd.randint(3, 300)
+        xs, ys = random_series(rnd, n)
+        threshold = rnd.randint(3, n)
+        bx = array('i', xs)
+        by = array('i', ys)
+        end = decimator.lttb(bx, by, 0, n, threshold, 0)
+        kept_xs = list(bx[:end])
+        kept_ys = list(by[:end])
+        assert end == threshold
+        assert (kept_xs[0], kept_ys[0]) == (xs[0], ys[0])
+        assert (kept_xs[-1], kept_ys[-1]) == (xs[-1], ys[-1])
+        assert subsequence(kept_xs, kept_ys, xs, ys)
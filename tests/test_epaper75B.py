@@ -0,0 +1,272 @@
+import gc
+import time
+import tracemalloc
+
+import uasyncio as asyncio
+
+import machine
+import utime
+from dataCollector import DataCollector
+import epaper75B
+from epaper75B import EPD_7in5_B
+from graphPager import GraphPaper
+
+
+# Busy pin that reads low (busy) `polls` times, then high once, and again
+class Busy:
+    def __init__(self, polls):
+        self.polls = polls
+        self.left = polls
+
+    def __call__(self):
+        if self.left:
+            self.left -= 1
+            return 0
+        self.left = self.polls
+        return 1
+
+    @property
+    def busy(self):
+        return self.left != self.polls
+
+
+# Command bytes sent with DC low, in order
+def commands():
+    dc = None
+    sent = []
+    for event in machine.trace:
+        if event[0] == 'pin':
+            if event[1] == epaper75B.DC_PIN:
+                dc = event[2]
+        elif dc == 0:
+            sent.extend(event[1])
+    return sent
+
+
+# (data bytes, pin events) sent after command `command`, up to the next
+# command
+def payload(command):
+    dc = None
+    data = bytearray()
+    pins = []
+    inside = False
+    for event in machine.trace:
+        if event[0] == 'pin':
+            if event[1] == epaper75B.DC_PIN:
+                dc = event[2]
+            if inside:
+                pins.append(event[1:])
+        elif dc == 0:
+            if inside:
+                break
+            inside = event[1] == bytes([command])
+            pins = []
+        elif inside:
+            data += event[1]
+    return bytes(data), pins
+
+
+def sample_frame(epd):
+    epd.imageblack.fill_rect(0, 0, 300, 100, epd.BLACK)
+    epd.imageblack.fill_rect(420, 200, 7, 130, epd.BLACK)
+    epd.imagered.fill_rect(50, 300, 600, 20, epd.RED)
+    epd.imagered.line(0, 479, 799, 0, epd.RED)
+
+
+def collectors():
+    data = []
+    for value in (21.5, 3.9):
+        collector = DataCollector(lambda v=value: v, interval=600)
+        for _ in range(3):
+            collector.add()
+            collector.commit()
+            utime.now[0] += 600
+        data.append(collector)
+    return data
+
+
+def test_display_async_yields_while_busy():
+    graph = GraphPaper(*collectors(), 600)
+    graph.epd.sleep()
+    del machine.trace[:]
+    busy = Busy(5)
+    machine.Pin.inputs[epaper75B.BUSY_PIN] = busy
+    ticks = []
+
+    async def other_task(done):
+        while not done:
+            if busy.busy:
+                ticks.append(busy.left)
+            await asyncio.sleep_ms(0)
+
+    async def main():
+        done = []
+        task = asyncio.create_task(other_task(done))
+        await graph.display_async()
+        done.append(True)
+        await task
+
+    asyncio.run(main())
+    assert ticks  # The other task ran during the busy periods
+    assert not graph.epd.powered
+
+    sent = commands()
+    # init (reset pulse, power on, panel setting) -> upload -> refresh -> sleep
+    first_reset = [e for e in machine.trace if e[0] == 'pin'][0]
+    assert first_reset[1] == epaper75B.RST_PIN
+    order = [sent.index(c) for c in (0x06, 0x04, 0x00, 0x10, 0x13, 0x12, 0x02, 0x07)]
+    assert order == sorted(order)
+
+
+def test_refresh_async_skips_unchanged_frame():
+    epd = EPD_7in5_B()
+    epd.imageblack.fill_rect(0, 0, 10, 10, epd.BLACK)
+    asyncio.run(epd.refresh_async())
+    del machine.trace[:]
+    assert asyncio.run(epd.refresh_async()) is None
+    assert epd.skipped_count == 1
+    assert commands() == []  # Panel left asleep
+
+
+def test_display_sends_planes_in_bulk():
+    epd = EPD_7in5_B()
+    sample_frame(epd)
+    del machine.trace[:]
+    epd.display()
+
+    # DC/CS change once per plane, not per byte: end of the command, one
+    # data transaction, start of the next command
+    dc = epaper75B.DC_PIN
+    cs = epaper75B.CS_PIN
+    expected = [(cs, 1), (dc, 1), (cs, 0), (cs, 1), (dc, 0), (cs, 0)]
+    black, pins = payload(0x10)
+    assert black == bytes(~b & 0xff for b in epd.buffer_balck)
+    assert pins == expected
+    red, pins = payload(0x13)
+    assert red == bytes(epd.buffer_red)
+    assert pins == expected
+
+
+# The per-byte upload display() used to do, for timing
+def send_per_byte(epd):
+    epd.send_command(0x10)
+    for b in epd.buffer_balck:
+        epd.send_data(~b & 0xff)
+    epd.send_command(0x13)
+    for b in epd.buffer_red:
+        epd.send_data(b)
+
+
+def test_display_upload_time():
+    epd = EPD_7in5_B()
+    sample_frame(epd)
+    machine.record = False
+    t = time.perf_counter()
+    epd.display()
+    bulk = time.perf_counter() - t
+    t = time.perf_counter()
+    send_per_byte(epd)
+    per_byte = time.perf_counter() - t
+    print('display() {:.1f} ms, per-byte upload {:.1f} ms'.format(
+        bulk * 1000, per_byte * 1000))
+    assert bulk < per_byte
+
+
+# Upload time and SPI writes against plane occupancy: the top `ink` share
+# of the rows is drawn, the rest left blank
+def test_upload_vs_occupancy():
+    epd = EPD_7in5_B()
+    machine.record = False
+    planes = ((0x10, epd.imageblack, epd.buffer_balck, True, epd.BLACK),
+              (0x13, epd.imagered, epd.buffer_red, False, epd.RED))
+    chunks = len(epd.buffer_balck) // len(epd.chunk)
+    print()
+    for command, image, buf, invert, color in planes:
+        for ink in (0, 10, 50, 100):
+            image.fill(0)
+            image.fill_rect(0, 0, epd.width, epd.height * ink // 100, color)
+            epd.spi.writes = 0
+            t = time.perf_counter()
+            epd.send_command(command)
+            epd.send_data_buffer(buf, invert)
+            elapsed = time.perf_counter() - t
+            writes = epd.spi.writes - 1  # Without the command byte
+            print('0x{:02x} {:3d}% ink: {:6.2f} ms, {} writes'.format(
+                command, ink, elapsed * 1000, writes))
+            # Black goes out one chunk per write, blank or not; red in one
+            assert writes == (chunks if invert else 1)
+    epd.spi.writes = 0
+    t = time.perf_counter()
+    epd.send_data_fill(0xff)
+    elapsed = time.perf_counter() - t
+    print('fill      : {:6.2f} ms, {} writes'.format(
+        elapsed * 1000, epd.spi.writes))
+    assert epd.spi.writes == chunks
+
+
+# Bytes allocated while f() runs, after a collection
+def measure(f):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    f()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - base
+
+
+def test_display_allocation_budget():
+    epd = EPD_7in5_B()
+    sample_frame(epd)
+    machine.record = False
+    full = measure(epd.display)
+    epd.imageblack.fill_rect(100, 200, 50, 20, epd.BLACK)
+    partial = measure(epd.display)
+    print('display() allocated {} bytes (full), {} bytes (partial)'.format(
+        full, partial))
+    # A copy of either plane would be 48000 bytes; what is left is the
+    # chunk buffer, the band slices and the log messages
+    assert full < 4096
+    assert partial < 4096
+
+
+# Count the memoryviews display() creates: memoryview() calls in
+# epaper75B, and slices, which all end up in crc32() or spi.write()
+def count_views(monkeypatch, epd):
+    counts = {'memoryview': 0, 'slices': 0}
+
+    def view(buf):
+        counts['memoryview'] += 1
+        return memoryview(buf)
+
+    def sink(f):
+        def wrapper(buf, *args):
+            if isinstance(buf, memoryview):
+                counts['slices'] += 1
+            return f(buf, *args)
+        return wrapper
+
+    monkeypatch.setattr(epaper75B, 'memoryview', view, raising=False)
+    monkeypatch.setattr(epaper75B.ubinascii, 'crc32',
+                        sink(epaper75B.ubinascii.crc32))
+    monkeypatch.setattr(epd.spi, 'write', sink(epd.spi.write))
+    return counts
+
+
+def test_display_memoryview_count(monkeypatch):
+    epd = EPD_7in5_B()
+    sample_frame(epd)
+    machine.record = False
+    counts = count_views(monkeypatch, epd)
+    epd.display()
+    # Full frame: one view per plane, one slice per plane per band
+    bands = epd.height // epaper75B.CHUNK_ROWS
+    assert counts == {'memoryview': 2, 'slices': 2 * bands}
+
+    counts.update(memoryview=0, slices=0)
+    epd.imageblack.fill_rect(100, 300, 50, 20, epd.BLACK)  # rows 288-320
+    epd.display()
+    # Two dirty bands: two checksum slices each, plus one view and one
+    # slice for the red part of the partial upload (the black part goes
+    # through the chunk buffer)
+    assert counts == {'memoryview': 3, 'slices': 2 * 2 + 1}
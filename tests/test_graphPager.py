@@ -0,0 +1,144 @@
+import math
+import random
+import time
+
+import framebuf
+from graphPager import polyline_w
+
+W = 64
+H = 48
+
+
+def frame():
+    buf = bytearray(W // 8 * H)
+    return buf, framebuf.FrameBuffer(buf, W, H, framebuf.MONO_HLSB)
+
+
+# Bresenham's line from (x1, y1) to (x2, y2), one pixel per step along the
+# major axis, starting with err = da // 2
+def bresenham(x1, y1, x2, y2):
+    steep = abs(y2 - y1) > abs(x2 - x1)
+    if steep:
+        x1, y1, x2, y2 = y1, x1, y2, x2
+    da = abs(x2 - x1)
+    db = abs(y2 - y1)
+    sa = 1 if x2 >= x1 else -1
+    sb = 1 if y2 >= y1 else -1
+    b = y1
+    err = da // 2
+    for i in range(da + 1):
+        a = x1 + sa * i
+        yield (b, a) if steep else (a, b)
+        err -= db
+        if err < 0:
+            b += sb
+            err += da
+
+
+# Reference: every segment drawn on its own, pixel by pixel, widened
+# across its minor axis
+def reference(fb, xs, ys, w, c):
+    o = w // 2
+    for i in range(len(xs) - 1):
+        x1, y1, x2, y2 = xs[i], ys[i], xs[i + 1], ys[i + 1]
+        steep = abs(y2 - y1) > abs(x2 - x1)
+        for x, y in bresenham(x1, y1, x2, y2):
+            for t in range(-o, w - o):
+                if steep:
+                    fb.pixel(x + t, y, c)
+                else:
+                    fb.pixel(x, y + t, c)
+
+
+def random_polyline(rnd):
+    xs = []
+    ys = []
+    x = rnd.randint(0, 20)
+    for _ in range(rnd.randint(2, 20)):
+        xs.append(x)
+        ys.append(rnd.randint(0, H - 1))
+        x += rnd.randint(0, 4)
+    return xs, ys
+
+
+def test_polyline_w_matches_per_segment_bresenham():
+    rnd = random.Random(5)
+    for _ in range(2000):
+        xs, ys = random_polyline(rnd)
+        w = rnd.randint(1, 4)
+        got, fb = frame()
+        polyline_w(fb, xs, ys, w, 1)
+        expected, fb = frame()
+        reference(fb, xs, ys, w, 1)
+        assert got == expected, (xs, ys, w)
+
+
+def test_polyline_w_keeps_steep_to_shallow_vertex():
+    # Regression: the vertex cross-section was skipped when a steep
+    # segment met a shallow one, leaving (15, 11) blank
+    xs = (6, 15, 19)
+    ys = (23, 12, 15)
+    got, fb = frame()
+    polyline_w(fb, xs, ys, 2, 1)
+    assert fb.pixel(15, 11) == 1
+    expected, fb = frame()
+    reference(fb, xs, ys, 2, 1)
+    assert got == expected
+
+
+def test_polyline_w_start_end():
+    xs = (0, 10, 20, 30, 40)
+    ys = (5, 30, 10, 40, 0)
+    got, fb = frame()
+    polyline_w(fb, xs, ys, 2, 1, 1, 4)
+    expected, fb = frame()
+    reference(fb, xs[1:4], ys[1:4], 2, 1)
+    assert got == expected
+
+
+# Counts the framebuf calls made through it
+class Counting:
+    def __init__(self, fb):
+        self.fb = fb
+        self.calls = 0
+
+    def fill_rect(self, *args):
+        self.calls += 1
+        self.fb.fill_rect(*args)
+
+    def line(self, *args):
+        self.calls += 1
+        self.fb.line(*args)
+
+
+# The w*w shifted framebuf.line calls polyline_w replaced
+def line_w_old(buf, point1, point2, w, c):
+    x1, y1 = point1
+    x2, y2 = point2
+    for i in range(-1*int(w/2), int(w/2)):
+        for j in range(-1*int(w/2), int(w/2)):
+            buf.line(x1+i, y1+j, x2+i, y2+j, c)
+
+
+def test_polyline_w_calls_and_time():
+    # A day of 10 minute samples of a slowly varying temperature
+    n = 108
+    xs = [i * 720 // n for i in range(n)]
+    ys = [int(160 + 20 * math.sin(2 * math.pi * i / n)) for i in range(n)]
+    buf = bytearray(800 // 8 * 320)
+    fb = framebuf.FrameBuffer(buf, 800, 320, framebuf.MONO_HLSB)
+
+    new = Counting(fb)
+    t = time.perf_counter()
+    polyline_w(new, xs, ys, 2, 1)
+    new_time = time.perf_counter() - t
+
+    old = Counting(fb)
+    t = time.perf_counter()
+    for i in range(n - 1):
+        line_w_old(old, (xs[i], ys[i]), (xs[i + 1], ys[i + 1]), 2, 1)
+    old_time = time.perf_counter() - t
+
+    print('polyline_w {} calls {:.1f} ms, line_w {} calls {:.1f} ms'.format(
+        new.calls, new_time * 1000, old.calls, old_time * 1000))
+    assert new.calls < old.calls
@@ -1,14 +1,26 @@
 import machine
+from adcSampler import AdcSampler
 
 
 class Thermometer:
-    def __init__(self):
+    # Pass an AdcSampler shared with other sensors to read them in one
+    # pass (sampler.read(), then value()).
+    def __init__(self, sampler=None):
         self.sensor_temp = machine.ADC(4)
         self.a = - 3.3 / (65535 * 0.001721)
         self.b = 27 + 0.706/0.001721
+        self.sampler = AdcSampler() if sampler is None else sampler
+        self.channel = self.sampler.add_channel(
+            self.sensor_temp, self.a, self.b)
 
+    # Oversampled, see AdcSampler
     def get(self):
-        temp = self.a * self.sensor_temp.read_u16() + self.b
+        self.sampler.read()
+        return self.value()
+
+    # Temperature from the last sampler.read()
+    def value(self):
+        temp = self.sampler.values[self.channel]
         # print(str(temp)+' '+chr(176)+'C')
         return round(temp, 1)
 